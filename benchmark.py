@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""Time the game's hot paths and write the numbers out as JSON.
+
+    python benchmark.py [--output=FILE] [--repeat=N] [--compare=OLD] [name ...]
+
+Runs every benchmark (or only the named ones) without opening a window:
+pyglet is told not to create a GL context, so shapes and renderers fill
+client-side vertex arrays. Each benchmark is run --repeat times and the best
+time is kept. Some benchmarks report more than time, such as how fragmented
+an allocator ends up; those numbers come from the last run.
+
+With --compare, a previous JSON file is read and the change in time per
+operation is printed next to each result. Results are written to
+benchmark.json unless --output says otherwise.
+
+"""
+
+import sys
+import json
+import time
+import random
+import getopt
+import platform
+import warnings
+
+sys.path.insert(1, 'pyglet-c9188efc2e30')
+
+import pyglet
+pyglet.options['shadow_window'] = False
+warnings.filterwarnings('ignore', 'No GL context created yet.')
+
+from pyglet.gl import gl_info
+from pyglet.graphics import allocation, vertexattribute, vertexdomain
+
+from ookoobah import core
+from ookoobah import game_mode
+from ookoobah import levels
+from ookoobah import render
+from ookoobah import session
+from ookoobah import shapes
+
+MAX_STEPS = 1000
+SESSION_STEPS = 20
+SHAPE_COUNT = 200
+CHURN_BLOCKS = 2000
+CHURN_STEPS = 20000
+DRAW_LISTS = 2000
+DRAW_COUNT = 1000
+
+SHAPES = (
+    shapes.Box,
+    shapes.Pyramid,
+    shapes.Disc,
+    shapes.Cross,
+    shapes.Ico,
+    shapes.Arrows,
+    shapes.Cloud,
+    shapes.Pine,
+    shapes.Spiral,
+)
+
+def level_filename(level_name):
+    return 'data/%s.level' % level_name
+
+def load_level(level_name):
+    with open(level_filename(level_name), 'rb') as level_file:
+        return levels.load(level_file)
+
+def bench_game_step():
+    """Steps per second over every level, each played up to MAX_STEPS."""
+    games = []
+    for level_name in game_mode.LEVELS:
+        game = core.Game(load_level(level_name), 0)
+        game.start()
+        games.append(game)
+
+    steps = 0
+    start = time.time()
+    for game in games:
+        while game.step_n < MAX_STEPS and game.step() == core.Game.STATUS_ON:
+            pass
+        steps += game.step_n
+    return time.time() - start, steps
+
+def bench_session():
+    """Start, play a few steps and reset a session of every level."""
+    sessions = [session.Session(load_level(level_name), 0) for level_name in game_mode.LEVELS]
+
+    start = time.time()
+    for sess in sessions:
+        sess.start()
+        for _ in range(SESSION_STEPS):
+            sess.step()
+        sess.reset()
+    return time.time() - start, len(sessions)
+
+def bench_level_load():
+    """Read and decode every level file."""
+    start = time.time()
+    for level_name in game_mode.LEVELS:
+        load_level(level_name)
+    return time.time() - start, len(game_mode.LEVELS)
+
+def bench_shapes():
+    """Build SHAPE_COUNT of each shape into one batch."""
+    batch = pyglet.graphics.Batch()
+    made = []
+
+    start = time.time()
+    for shape_class in SHAPES:
+        for i in range(SHAPE_COUNT):
+            made.append(shape_class(batch, None, (i, 0, 0), (1, 1, 1), (.5, .5, .5)))
+    elapsed = time.time() - start
+
+    for shape in made:
+        shape.delete()
+    return elapsed, len(made)
+
+def bench_grid_renderer():
+    """Create the renderers for every block of every level."""
+    grids = [load_level(level_name) for level_name in game_mode.LEVELS]
+    batch = pyglet.graphics.Batch()
+    renderers = []
+    for grid in grids:
+        # Start empty, so that only the update below is timed
+        renderer = render.GridRenderer({}, batch)
+        renderer.grid = grid
+        renderers.append(renderer)
+
+    blocks = 0
+    start = time.time()
+    for renderer in renderers:
+        renderer.update(True)
+        blocks += len(renderer)
+    elapsed = time.time() - start
+
+    for renderer in renderers:
+        renderer.delete()
+    return elapsed, blocks
+
+def churn_allocator(allocator_class):
+    """Place and remove blocks at random, like a long editor session.
+
+    Every block takes the vertex count of one of the shapes. The buffer
+    grows to the next power of two when full, the way a vertex domain does.
+    """
+    sizes = [len(shapes.build_mesh(shape_class.shape, False)[0]) // 3 for shape_class in SHAPES]
+    rand = random.Random(0)
+    allocator = allocator_class(16)
+    regions = []
+
+    def alloc(size):
+        try:
+            return allocator.alloc(size)
+        except allocation.AllocatorMemoryException, e:
+            allocator.set_capacity(vertexdomain._nearest_pow2(e.requested_capacity))
+            return allocator.alloc(size)
+
+    start = time.time()
+    for i in range(CHURN_BLOCKS):
+        size = rand.choice(sizes)
+        regions.append((alloc(size), size))
+    for i in range(CHURN_STEPS):
+        index = rand.randrange(len(regions))
+        allocator.dealloc(*regions[index])
+        size = rand.choice(sizes)
+        regions[index] = (alloc(size), size)
+    elapsed = time.time() - start
+
+    return elapsed, CHURN_BLOCKS + CHURN_STEPS * 2, {
+        'capacity': allocator.capacity,
+        'regions': len(allocator.get_allocated_regions()[0]),
+        'fragmentation': allocator.get_fragmentation(),
+    }
+
+def bench_allocator():
+    """Allocator churn with pyglet's free-list allocator."""
+    return churn_allocator(allocation.FreeListAllocator)
+
+def bench_allocator_linear():
+    """The same churn with pyglet's original allocator, for comparison."""
+    return churn_allocator(allocation.Allocator)
+
+class GLCounter(object):
+    """Stands in for the GL functions of some modules, counting calls."""
+
+    def __init__(self, modules, version):
+        self.modules = modules
+        self.version = version
+        self.calls = 0
+        self.saved = []
+
+    def __enter__(self):
+        for module in self.modules:
+            for name, value in vars(module).items():
+                if name.startswith('gl') and callable(value) and not isinstance(value, type):
+                    self.saved.append((module, name, value))
+                    setattr(module, name, self.count)
+        self.saved_version = gl_info._gl_info.version
+        gl_info._gl_info.version = self.version
+        return self
+
+    def __exit__(self, *exc_info):
+        for module, name, value in self.saved:
+            setattr(module, name, value)
+        gl_info._gl_info.version = self.saved_version
+
+    def count(self, *args):
+        self.calls += 1
+
+def draw_domain(version):
+    """Draw a domain with every other vertex list deleted.
+
+    There is no GL context, so the GL calls are counted rather than made:
+    this times the Python side of drawing. `version` is the GL version to
+    pretend to have; glMultiDrawArrays needs 1.4.
+    """
+    domain = vertexdomain.create_domain('v3f', 'c4f')
+    lists = [domain.create(36) for i in range(DRAW_LISTS)]
+    for vertex_list in lists[::2]:
+        vertex_list.delete()
+
+    with GLCounter((vertexdomain, vertexattribute), version) as counter:
+        start = time.time()
+        for i in range(DRAW_COUNT):
+            domain.draw(pyglet.gl.GL_TRIANGLES)
+        elapsed = time.time() - start
+
+    return elapsed, DRAW_COUNT, {
+        'regions': len(domain.allocator.get_allocated_regions()[0]),
+        'gl_calls': counter.calls / DRAW_COUNT,
+    }
+
+def bench_domain_draw():
+    """Draw a fragmented domain with one glMultiDrawArrays."""
+    return draw_domain('1.4')
+
+def bench_domain_draw_separate():
+    """The same draw on GL 1.3, with a glDrawArrays per region."""
+    return draw_domain('1.3')
+
+BENCHMARKS = (
+    ('game_step', bench_game_step),
+    ('session_start_reset', bench_session),
+    ('level_load', bench_level_load),
+    ('shape_construction', bench_shapes),
+    ('grid_renderer_update', bench_grid_renderer),
+    ('allocator_churn', bench_allocator),
+    ('allocator_churn_linear', bench_allocator_linear),
+    ('domain_draw', bench_domain_draw),
+    ('domain_draw_separate', bench_domain_draw_separate),
+)
+
+def run(func, repeat):
+    best = None
+    for _ in range(repeat):
+        result = func()
+        elapsed, ops = result[:2]
+        if best is None or elapsed < best:
+            best = elapsed
+    report = {
+        'seconds': best,
+        'ops': ops,
+        'per_op': best / ops if ops else None,
+    }
+    if len(result) > 2:
+        report['stats'] = result[2]
+    return report
+
+def main(argv):
+    opts, names = getopt.getopt(argv, "o:r:c:", ["output=", "repeat=", "compare="])
+    opts = dict(opts)
+    output = opts.get("-o", opts.get("--output", "benchmark.json"))
+    repeat = int(opts.get("-r", opts.get("--repeat", 5)))
+    compare = opts.get("-c", opts.get("--compare"))
+
+    previous = {}
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f)['results']
+
+    results = {}
+    for name, func in BENCHMARKS:
+        if names and name not in names:
+            continue
+        result = results[name] = run(func, repeat)
+        line = "%-24s %10.6fs %8d ops %12.3fus/op" % (name, result['seconds'], result['ops'], result['per_op'] * 1e6)
+        if name in previous and previous[name]['per_op']:
+            line += " %+7.1f%%" % ((result['per_op'] / previous[name]['per_op'] - 1) * 100)
+        for key, value in sorted(result.get('stats', {}).items()):
+            line += " %s=%.4g" % (key, value)
+        print line
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+        'repeat': repeat,
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
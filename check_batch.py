@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Check that the lock-step simulator plays exactly like core.Game.
+
+    python check_batch.py [--placements=N] [--steps=N] [--seed=N] data/*.level
+
+Each level is played as saved, and N more times (default 40) with its
+unlocked blocks put down again at random on empty cells inside the level,
+each turned a random number of times. All of them go into one BatchGame
+and are stepped next to a core.Game of their own. After every step the
+status, ball, step count and the state of every block must match.
+Portal games get a seed each, so their random jumps must match too.
+
+Requires NumPy, like ookoobah.batch.
+
+"""
+
+import sys
+import time
+import random
+import getopt
+
+from ookoobah import batch
+from ookoobah import core
+from ookoobah import levels
+
+def make_grids(grid, placements, rand):
+    """Return the saved grid and `placements` others with its unlocked blocks moved."""
+    game = core.Game(dict(grid))
+    game.build_inventory()
+    min_x, min_y, max_x, max_y = core.get_bounds(grid)
+    empty = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+        if (x, y) not in game.grid]
+    blocks = [block_class for block_class, count in game.inventory.items() for _ in range(count)]
+
+    grids = [grid]
+    for _ in range(placements):
+        other = levels.loads(levels.dumps(game.grid))
+        for block_class, pos in zip(blocks, rand.sample(empty, min(len(blocks), len(empty)))):
+            block = block_class()
+            for _ in range(rand.randrange(len(block_class.all_states))):
+                block.cycle_states()
+            block.locked = False
+            other[pos] = block
+        grids.append(other)
+    return grids
+
+def compare(games, batch_game, i):
+    game = games[i]
+    if batch_game.get_status(i) != game.get_status():
+        return "status %s, expected %s" % (batch_game.get_status(i), game.get_status())
+    if batch_game.get_ball(i) != (game.ball.pos, game.ball.direction):
+        return "ball %r, expected %r" % (batch_game.get_ball(i), (game.ball.pos, game.ball.direction))
+    if batch_game.step_n[i] != game.step_n:
+        return "step %d, expected %d" % (batch_game.step_n[i], game.step_n)
+    for pos, block in game.grid.iteritems():
+        if batch_game.get_value(i, pos) != batch_game._value(block):
+            return "%s at %r is %d, expected %d" % (block.__class__.__name__, pos,
+                batch_game.get_value(i, pos), batch_game._value(block))
+    return None
+
+def check(grid, placements, steps, rand):
+    grids = make_grids(grid, placements, rand)
+    seeds = [rand.randrange(1 << 30) for _ in grids]
+    # Grids are copied through the level format, so no block is shared
+    games = [core.Game(levels.loads(levels.dumps(grid)), seed) for grid, seed in zip(grids, seeds)]
+    for game in games:
+        game.start()
+    batch_game = batch.BatchGame(grids, seeds)
+
+    for step in range(steps):
+        for game in games:
+            game.step()
+        batch_game.step()
+        for i in range(len(games)):
+            error = compare(games, batch_game, i)
+            if error:
+                return False, "game %d differs after step %d: %s" % (i, step + 1, error)
+
+    return True, "%d games match for %d steps" % (len(games), steps)
+
+def main(argv):
+    opts, filenames = getopt.getopt(argv, "", ["placements=", "steps=", "seed="])
+    opts = dict(opts)
+    placements = int(opts.get("--placements", 40))
+    steps = int(opts.get("--steps", 200))
+    rand = random.Random(int(opts.get("--seed", 1)))
+
+    start = time.time()
+    failed = 0
+    for filename in filenames:
+        with open(filename, 'rb') as level_file:
+            grid = levels.load(level_file)
+        ok, report = check(grid, placements, steps, rand)
+        failed += not ok
+        print "%-40s %s" % (filename, report)
+    elapsed = time.time() - start
+    print "%d levels in %.3fs, %d failed" % (len(filenames), elapsed, failed)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
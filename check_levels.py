@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Run level files headless and report how each one plays out.
+
+    python check_levels.py [--solve] [--processes=N] data/*.level
+
+With --solve, unlocked blocks are taken out into the inventory and the level
+is searched for every placement that wins it. If some placement is still
+going when the step budget runs out, the count is only a lower bound and
+is marked "(truncated)".
+
+"""
+
+import sys
+import time
+import getopt
+
+from ookoobah import headless
+from ookoobah import levels
+from ookoobah import solver
+
+def check(grid):
+    result = headless.run(grid)
+    return "%-8s %6d steps%s" % (result.status, result.steps,
+        " (repeats step %d)" % result.loop_start if result.loops_forever else "")
+
+def solve(grid, processes):
+    try:
+        solutions, truncated = solver.solve_level(grid, processes=processes)
+    except solver.Solver.Error as e:
+        return "can't solve: %s" % e
+    if truncated:
+        return "\xe2\x89\xa5%d solutions (truncated)" % len(solutions)
+    return "%d solutions" % len(solutions)
+
+def main(argv):
+    opts, filenames = getopt.getopt(argv, "sp:", ["solve", "processes="])
+    opts = dict(opts)
+    do_solve = "-s" in opts or "--solve" in opts
+    processes = int(opts.get("-p", opts.get("--processes", 1)))
+
+    start = time.time()
+    for filename in filenames:
+        with open(filename, 'rb') as level_file:
+            grid = levels.load(level_file)
+        report = solve(grid, processes) if do_solve else check(grid)
+        print "%-40s %s" % (filename, report)
+    elapsed = time.time() - start
+    print "%d levels in %.3fs" % (len(filenames), elapsed)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""Check that session snapshots put a game back exactly as it was.
+
+    python check_snapshots.py [--actions=N] [--runs=N] [--seed=N] data/*.level
+
+Each level is loaded both as a dict and as a DenseGrid, its unlocked blocks
+go to the inventory and the session is started. Then N random actions
+(default 300) are made, the way the game and the editor make them: steps,
+blocks placed, erased, cycled and locked, snapshots taken, restored and
+forgotten. Whenever a snapshot is restored, the whole game must equal what
+it was when the snapshot was taken. That includes every block, the ball,
+the inventory, the flip-flop count, the random generator and the replay
+log. Finally the session is reset and must equal the game as it was before
+the start.
+
+"""
+
+import sys
+import time
+import random
+import getopt
+
+from ookoobah import core
+from ookoobah import densegrid
+from ookoobah import levels
+from ookoobah import session
+
+# Blocks that can come and go while the ball moves; the others are set up
+# by `core.Game.start`
+LOOSE_BLOCKS = (core.Wall, core.Mirror, core.FlipFlopMirror, core.OneWay, core.Trap,
+    core.FlipFlop, core.Swamp)
+
+NAMES = ("a", "b", "c")
+
+def get_signature(game):
+    """Everything a snapshot has to bring back."""
+    ball = game.ball
+    return (
+        sorted((pos, block.__class__.__name__, block.get_state(), block.locked)
+            for pos, block in game.grid.items()),
+        ball and (ball.pos, ball.direction, ball.status),
+        game.step_n,
+        game.flipflops_off,
+        sorted((block_class.__name__, count) for block_class, count in game.inventory.items() if count),
+        game.exit_pos,
+        game.exit and game.exit.is_on,
+        game.random.getstate(),
+        game.log.tostring(),
+    )
+
+def act(game_session, saved, rand, bounds):
+    """Make one random action; return an error message if a restore was off."""
+    game = game_session.game
+    min_x, min_y, max_x, max_y = bounds
+    pos = (rand.randint(min_x, max_x), rand.randint(min_y, max_y))
+    block = game.grid.get(pos)
+    action = rand.random()
+
+    if action < .5:
+        game_session.step()
+    elif action < .6:
+        if block is None or isinstance(block, LOOSE_BLOCKS):
+            game.place_block(pos, rand.choice(LOOSE_BLOCKS), False)
+    elif action < .65:
+        if isinstance(block, LOOSE_BLOCKS):
+            game.erase_block(pos)
+    elif action < .75:
+        if block is not None:
+            game.cycle_block(pos)
+    elif action < .8:
+        if block is not None:
+            game.lock_block(pos, not block.locked)
+    elif action < .9:
+        name = rand.choice(NAMES)
+        game_session.snapshot(name)
+        saved.append((name, get_signature(game)))
+    elif len(saved) > 1:
+        # The start snapshot is left for the final reset
+        name, signature = rand.choice(saved[1:])
+        idx = max(idx for idx, (other, _) in enumerate(saved) if other == name)
+        if action < .97:
+            game_session.restore(name)
+            if get_signature(game) != saved[idx][1]:
+                return "restore of %r differs" % name
+            del saved[idx + 1:]
+        else:
+            game_session.forget(name)
+            del saved[idx]
+
+    if game.flipflops_off != sum(1 for pos, block in core.find_blocks(game.grid, core.FlipFlop)
+            if not block.is_on):
+        return "flip-flop count is off"
+    return None
+
+def check(grid, actions, runs, rand):
+    bounds = core.get_bounds(grid)
+    for make_grid in (dict, densegrid.DenseGrid):
+        for run in range(runs):
+            game_session = session.Session(make_grid(levels.loads(levels.dumps(grid))), rand.randrange(1 << 30))
+            game = game_session.game
+            game.log = core.Log()
+            game.build_inventory()
+
+            before = get_signature(game)
+            game_session.start()
+            saved = [(session.Session.START, before)]
+            for action in range(actions):
+                error = act(game_session, saved, rand, bounds)
+                if error:
+                    return False, "%s, run %d, action %d: %s" % (make_grid.__name__, run, action, error)
+
+            game_session.reset()
+            if get_signature(game) != before:
+                return False, "%s, run %d: reset differs" % (make_grid.__name__, run)
+            if game_session.snapshots or game.journal is not None:
+                return False, "%s, run %d: snapshots left after reset" % (make_grid.__name__, run)
+
+    return True, "%d runs of %d actions restore exactly" % (2 * runs, actions)
+
+def main(argv):
+    opts, filenames = getopt.getopt(argv, "", ["actions=", "runs=", "seed="])
+    opts = dict(opts)
+    actions = int(opts.get("--actions", 300))
+    runs = int(opts.get("--runs", 10))
+    rand = random.Random(int(opts.get("--seed", 1)))
+
+    start = time.time()
+    failed = 0
+    for filename in filenames:
+        with open(filename, 'rb') as level_file:
+            grid = levels.load(level_file)
+        ok, report = check(grid, actions, runs, rand)
+        failed += not ok
+        print "%-40s %s" % (filename, report)
+    elapsed = time.time() - start
+    print "%d levels in %.3fs, %d failed" % (len(filenames), elapsed, failed)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
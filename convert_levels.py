@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""Rewrite level files in the current level format.
+
+    python convert_levels.py data/*.level
+
+Files already in the current format are rewritten unchanged.
+
+"""
+
+import sys
+
+from ookoobah import levels
+
+def main(filenames):
+    for filename in filenames:
+        with open(filename, 'rb') as level_file:
+            data = level_file.read()
+        new_data = levels.dumps(levels.loads(data))
+        with open(filename, 'wb') as level_file:
+            level_file.write(new_data)
+        print "%-40s %6d -> %6d bytes" % (filename, len(data), len(new_data))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
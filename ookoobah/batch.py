@@ -0,0 +1,217 @@
+"""Lock-step simulation of many games at once.
+
+Steps N independent games together with NumPy, for scoring levels under
+many alternative placements. All grids are laid over one bounding box and
+stored as flat arrays: the block type per cell (the `densegrid` codes, i.e.
+positions in `core.ALL_BLOCKS`), one small value per cell for the block's
+state, and the portal destinations. The ball positions, directions and
+statuses are arrays with one entry per game.
+
+Every inner move of `core.Game.step` is one pass over the games that are
+still moving, with the rules of each block type applied to the games whose
+ball just entered such a block. Random portal jumps are drawn from each
+game's own random generator in the same order as `core.Game.step` would, so
+the results match it exactly.
+
+Requires NumPy, unlike the game itself.
+
+"""
+
+import numpy
+
+import core
+from densegrid import CODES
+
+EXIT = CODES[core.Exit]
+WALL = CODES[core.Wall]
+FLIPFLOP = CODES[core.FlipFlop]
+MIRROR = CODES[core.Mirror]
+FLIPFLOPMIRROR = CODES[core.FlipFlopMirror]
+ONEWAY = CODES[core.OneWay]
+PORTAL = CODES[core.Portal]
+TRAP = CODES[core.Trap]
+
+DIRECTIONS = core.Ball.DIRECTIONS
+DIRECTION_DX = numpy.array([dx for dx, dy in DIRECTIONS], numpy.int32)
+DIRECTION_DY = numpy.array([dy for dx, dy in DIRECTIONS], numpy.int32)
+
+STATUSES = {
+    core.Ball.STATUS_ALIVE: core.Game.STATUS_ON,
+    core.Ball.STATUS_DEAD: core.Game.STATUS_DEFEAT,
+    core.Ball.STATUS_LEFT: core.Game.STATUS_VICTORY,
+}
+
+class BatchGame(object):
+    def __init__(self, grids, seeds=None):
+        """Start a `core.Game` for each of `grids` and encode it."""
+        games = []
+        for grid, seed in zip(grids, seeds or [None] * len(grids)):
+            game = core.Game(dict(grid.iteritems()), seed)
+            game.start()
+            games.append(game)
+
+        xs = [x for game in games for x, y in game.grid]
+        ys = [y for game in games for x, y in game.grid]
+        self.x0, self.y0 = min(xs), min(ys)
+        self.width = max(xs) - self.x0 + 1
+        self.height = max(ys) - self.y0 + 1
+        self.size = size = self.width * self.height
+
+        self.games = games
+        self.random_portals = {}
+
+        n = len(games)
+        self.x = numpy.zeros(n, numpy.int32)
+        self.y = numpy.zeros(n, numpy.int32)
+        self.dx = numpy.zeros(n, numpy.int32)
+        self.dy = numpy.zeros(n, numpy.int32)
+        self.status = numpy.zeros(n, numpy.int8)
+        self.flipflops_off = numpy.zeros(n, numpy.int32)
+        self.step_n = numpy.zeros(n, numpy.int32)
+
+        cells, codes, values, portals, targets = [], [], [], [], []
+        for i, game in enumerate(games):
+            base = i * size
+            for pos, block in game.grid.iteritems():
+                cell = base + self._cell(pos)
+                cells.append(cell)
+                codes.append(CODES[block.__class__])
+                values.append(self._value(block))
+                if isinstance(block, core.Portal):
+                    portals.append(cell)
+                    if len(block.other_portals) > 1:
+                        # Picked from the game's own random generator as we go
+                        self.random_portals[cell] = block.other_portals
+                        targets.append(-1)
+                    else:
+                        targets.append(base + self._cell(block.other_portals[0]))
+
+            ball = game.ball
+            self.x[i], self.y[i] = ball.pos
+            self.dx[i], self.dy[i] = ball.direction
+            self.status[i] = ball.status
+            self.flipflops_off[i] = game.flipflops_off
+            self.step_n[i] = game.step_n
+
+        self.codes = numpy.zeros(n * size, numpy.int8)
+        self.codes[cells] = codes
+        # FlipFlop: is_on, Mirror: slope, OneWay: index into DIRECTIONS
+        self.values = numpy.zeros(n * size, numpy.int8)
+        self.values[cells] = values
+        # Portal: cell the ball jumps to
+        self.targets = numpy.zeros(n * size, numpy.int32)
+        self.targets[portals] = targets
+
+    def _cell(self, (x, y)):
+        return (y - self.y0) * self.width + x - self.x0
+
+    def _value(self, block):
+        if isinstance(block, core.FlipFlop):
+            return block.is_on
+        elif isinstance(block, core.Mirror):
+            return block.slope
+        elif isinstance(block, core.OneWay):
+            return DIRECTIONS.index(block.direction)
+        return 0
+
+    def __len__(self):
+        return len(self.status)
+
+    def step(self):
+        """Advance every game that is still on by one `core.Game.step`."""
+        active = numpy.flatnonzero(self.status == core.Ball.STATUS_ALIVE)
+        games = active
+
+        while games.size:
+            x = self.x[games] + self.dx[games]
+            y = self.y[games] + self.dy[games]
+            self.x[games] = x
+            self.y[games] = y
+
+            # Anything outside the box is empty and stops the ball
+            x -= self.x0
+            y -= self.y0
+            inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+            games = games[inside]
+            cells = games * self.size + y[inside] * self.width + x[inside]
+            codes = self.codes[cells]
+
+            keep = codes == WALL
+            for code, rule in self.RULES:
+                hit = codes == code
+                if hit.any():
+                    rule(self, games[hit], cells[hit])
+
+            games = games[keep]
+
+        self.step_n[active] += 1
+
+    def _wall(self, games, cells):
+        self.dx[games] *= -1
+        self.dy[games] *= -1
+
+    def _mirror(self, games, cells):
+        slope = self.values[cells]
+        dx = self.dx[games]
+        self.dx[games] = self.dy[games] * slope
+        self.dy[games] = dx * slope
+
+    def _flipflop_mirror(self, games, cells):
+        self._mirror(games, cells)
+        self.values[cells] *= -1
+
+    def _oneway(self, games, cells):
+        direction = self.values[cells]
+        self.dx[games] = DIRECTION_DX[direction]
+        self.dy[games] = DIRECTION_DY[direction]
+
+    def _exit(self, games, cells):
+        # The exit is on exactly when no flip-flop is off
+        games = games[self.flipflops_off[games] == 0]
+        self.status[games] = core.Ball.STATUS_LEFT
+
+    def _flipflop(self, games, cells):
+        is_on = 1 - self.values[cells]
+        self.values[cells] = is_on
+        self.flipflops_off[games] += 1 - 2 * is_on
+
+    def _trap(self, games, cells):
+        self.status[games] = core.Ball.STATUS_DEAD
+
+    def _portal(self, games, cells):
+        target = self.targets[cells]
+        for idx in numpy.flatnonzero(target < 0):
+            game = self.games[games[idx]]
+            target[idx] = self._cell(game.random.choice(self.random_portals[cells[idx]]))
+            target[idx] += games[idx] * self.size
+        target -= games * self.size
+        self.x[games] = target % self.width + self.x0
+        self.y[games] = target // self.width + self.y0
+
+    RULES = (
+        (WALL, _wall),
+        (MIRROR, _mirror),
+        (FLIPFLOPMIRROR, _flipflop_mirror),
+        (ONEWAY, _oneway),
+        (EXIT, _exit),
+        (FLIPFLOP, _flipflop),
+        (TRAP, _trap),
+        (PORTAL, _portal),
+    )
+
+    def run(self, max_steps):
+        for _ in range(max_steps):
+            if not (self.status == core.Ball.STATUS_ALIVE).any():
+                break
+            self.step()
+
+    def get_status(self, i):
+        return STATUSES[self.status[i]]
+
+    def get_ball(self, i):
+        """Return the ball position and direction of game `i`."""
+        return (int(self.x[i]), int(self.y[i])), (int(self.dx[i]), int(self.dy[i]))
+
+    def get_value(self, i, pos):
+        """Return the state value (is_on, slope or direction index) of a block in game `i`."""
+        return int(self.values[i * self.size + self._cell(pos)])
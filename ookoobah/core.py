@@ -1,6 +1,59 @@
 import random
+from array import array
 from inventory import Inventory
-import sounds
+
+class Log(object):
+    """Compact record of what happened during a run.
+
+    Every entry is five ints: the step it happened in, its kind, a position
+    and a value. Each step logs the blocks the ball entered (ACT), portal
+    jumps (PORTAL), the ball at the end of the step (BALL, value is the index
+    into Ball.DIRECTIONS) and, when the ball died or left, its new status
+    (STATUS). See the replay module for playing a log back.
+    """
+
+    ACT = 0
+    PORTAL = 1
+    BALL = 2
+    STATUS = 3
+
+    ENTRY_SIZE = 5
+
+    def __init__(self, data=''):
+        self.data = array('i')
+        self.data.fromstring(data)
+
+    def record(self, step, kind, x, y, value):
+        self.data.extend((step, kind, x, y, value))
+
+    def __iter__(self):
+        data = self.data
+        for idx in range(0, len(data), Log.ENTRY_SIZE):
+            yield tuple(data[idx:idx + Log.ENTRY_SIZE])
+
+    def __len__(self):
+        return len(self.data) // Log.ENTRY_SIZE
+
+    def __eq__(self, other):
+        return self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    def truncate(self, length):
+        del self.data[length * Log.ENTRY_SIZE:]
+
+    def diff(self, other):
+        """Return the first entry where the logs differ, or None."""
+        for idx, (mine, theirs) in enumerate(zip(self, other)):
+            if mine != theirs:
+                return idx
+        if len(self) != len(other):
+            return min(len(self), len(other))
+        return None
+
+    def tostring(self):
+        return self.data.tostring()
 
 class Ball(object):
     DIR_RIGHT = (1, 0)
@@ -8,6 +61,8 @@ class Ball(object):
     DIR_LEFT = (-1, 0)
     DIR_UP = (0, -1)
 
+    DIRECTIONS = (DIR_RIGHT, DIR_DOWN, DIR_LEFT, DIR_UP)
+
     STATUS_ALIVE = 0
     STATUS_DEAD = 1
     STATUS_LEFT = 2
@@ -27,11 +82,22 @@ class Block(object):
     all_states = ((),)
     all_states_idx = -1
 
+    # Everything about a block that may change once it is on the grid
+    STATE_FIELDS = ('is_on', 'slope', 'direction', 'all_states_idx', 'locked')
+
     def __init__(self):
         self.locked = True
         self.cycle_states()
 
-    def act(self, ball):
+    def get_state(self):
+        return tuple(self.__dict__.get(k) for k in Block.STATE_FIELDS)
+
+    def set_state(self, state):
+        for k, v in zip(Block.STATE_FIELDS, state):
+            if v is not None:
+                setattr(self, k, v)
+
+    def act(self, game, ball):
         raise NotImplementedError()
 
     def cycle_states(self):
@@ -50,18 +116,18 @@ class Launcher(Block):
         (("direction", Ball.DIR_UP),),
     )
 
-    def act(self, ball):
+    def act(self, game, ball):
         pass
 
 class Wall(Block):
     human_name = 'Wall'
 
-    def act(self, ball):
+    def act(self, game, ball):
         ball.direction = (
             -ball.direction[0],
             -ball.direction[1],
         )
-        sounds.play('wall.wav')
+        game.emit(Game.EVENT_WALL)
         return True
 
 class OneWay(Block):
@@ -73,8 +139,8 @@ class OneWay(Block):
         (("direction", Ball.DIR_UP),),
     )
 
-    def act(self, ball):
-        sounds.play('mirror.wav')
+    def act(self, game, ball):
+        game.emit(Game.EVENT_MIRROR)
         ball.direction = self.direction
 
 class Mirror(Block):
@@ -88,20 +154,19 @@ class Mirror(Block):
         (("slope", SLOPE_FORWARD),),
     )
 
-    def act(self, ball):
+    def act(self, game, ball):
         ball.direction = (
             ball.direction[1] * self.slope,
             ball.direction[0] * self.slope,
         )
-        sounds.play('mirror.wav')
+        game.emit(Game.EVENT_MIRROR)
 
 class FlipFlopMirror(Mirror):
     human_name = 'Flip mirror'
 
-    def act(self, ball):
-        super(FlipFlopMirror, self).act(ball)
+    def act(self, game, ball):
+        super(FlipFlopMirror, self).act(game, ball)
         self.cycle_states()
-        sounds.play('mirror.wav')
 
 class Exit(Block):
     human_name = 'Finish'
@@ -110,10 +175,10 @@ class Exit(Block):
         (("is_on", False),),
     )
 
-    def act(self, ball):
+    def act(self, game, ball):
         if self.is_on:
             ball.status = Ball.STATUS_LEFT
-            sounds.play('victory.wav')
+            game.emit(Game.EVENT_VICTORY)
 
 class FlipFlop(Block):
     human_name = 'Bit'
@@ -123,30 +188,50 @@ class FlipFlop(Block):
         (("is_on", True),),
     )
 
-    def act(self, ball):
-        self.is_on = not self.is_on
-        if self.is_on:
-            sounds.play('flip-on.wav')
-        else:
-            sounds.play('flip-off.wav')
+    def act(self, game, ball):
+        game.toggle_flipflop(self)
+        game.emit(Game.EVENT_FLIP_ON if self.is_on else Game.EVENT_FLIP_OFF)
 
 class Trap(Block):
     human_name = 'Trap'
-    def act(self, ball):
+    def act(self, game, ball):
         ball.status = Ball.STATUS_DEAD
 
 class Swamp(Block):
     human_name = 'Cloud'
 
-    def act(self, ball):
+    def act(self, game, ball):
         pass
 
 class Portal(Block):
     human_name = 'Portal'
 
-    def act(self, ball):
-        ball.pos = random.choice(self.other_portals)
-        sounds.play('portal.wav')
+    def act(self, game, ball):
+        ball.pos = game.random.choice(self.other_portals)
+        game.record(Log.PORTAL, ball.pos)
+        game.emit(Game.EVENT_PORTAL)
+
+def find_blocks(grid, block_classes):
+    """Yield `(pos, block)` for the blocks in `grid` of `block_classes`.
+
+    Grids that can do better than looking at every block provide `find`.
+    """
+    find = getattr(grid, 'find', None)
+    if find:
+        return find(block_classes)
+    return ((pos, block) for pos, block in grid.iteritems() if isinstance(block, block_classes))
+
+def get_bounds(grid):
+    """Return `(min_x, min_y, max_x, max_y)` of the positions in `grid`.
+
+    Grids that keep their bounds provide `bounds`.
+    """
+    bounds = getattr(grid, 'bounds', None)
+    if bounds:
+        return bounds()
+    xs = [x for x, y in grid]
+    ys = [y for x, y in grid]
+    return min(xs), min(ys), max(xs), max(ys)
 
 class Game(object):
     STATUS_NEW = "new"
@@ -154,33 +239,104 @@ class Game(object):
     STATUS_VICTORY = "victory"
     STATUS_DEFEAT = "defeat"
 
-    def __init__(self, grid):
+    EVENT_WALL = "wall"
+    EVENT_MIRROR = "mirror"
+    EVENT_FLIP_ON = "flip-on"
+    EVENT_FLIP_OFF = "flip-off"
+    EVENT_PORTAL = "portal"
+    EVENT_VICTORY = "victory"
+
+    def __init__(self, grid, seed=None):
         self.step_n = 0
         self.grid = grid
+        self.random = random.Random(seed)
+        # A Log, when the run is being recorded (see the replay module)
+        self.log = None
+        # A list that collects EVENT_* for whoever presents the game
+        self.events = None
         self.inventory = Inventory()
         self.ball = None
         self.exit = None
+        self.exit_pos = None
+        # Filled in by session.Snapshot: blocks as they were before changing
+        self.journal = None
+        # A set that collects positions of changed blocks, for the renderer
+        self.changed = None
+        self.count_flipflops()
+
+    def emit(self, event):
+        if self.events is not None:
+            self.events.append(event)
+
+    def record(self, kind, (x, y)=(0, 0), value=0):
+        if self.log is not None:
+            self.log.record(self.step_n, kind, x, y, value)
+
+    def touch(self, pos):
+        """Record the block at `pos` in the journal before it changes."""
+        if self.changed is not None:
+            self.changed.add(pos)
+        if self.journal is not None and pos not in self.journal:
+            block = self.grid.get(pos)
+            self.journal[pos] = (block, block.get_state() if block else None)
+
+    def count_flipflops(self):
+        self.flipflops_off = sum(1 for pos, block in find_blocks(self.grid, FlipFlop)
+            if not block.is_on)
+
+    def _track_block(self, block, delta):
+        if isinstance(block, FlipFlop) and not block.is_on:
+            self.flipflops_off += delta
 
     def build_inventory(self):
         for pos, block in self.grid.items():
             if not block.locked:
+                self.touch(pos)
                 del self.grid[pos]
+                self._track_block(block, -1)
                 self.inventory.add_block(block.__class__)
 
     def erase_block(self, pos):
+        self.touch(pos)
         try:
-            self.inventory.add_block(self.grid[pos].__class__)
-            del self.grid[pos]
+            block = self.grid.pop(pos)
         except KeyError:
-            pass
+            return
+        self._track_block(block, -1)
+        self.inventory.add_block(block.__class__)
 
     def place_block(self, pos, block_class, use_inventory=True):
         self.erase_block(pos)
         if use_inventory:
             self.inventory.use_block(block_class)
-        self.grid[pos] = block_class()
+        self.touch(pos)
+        block = self.grid[pos] = block_class()
+        self._track_block(block, 1)
+
+    def cycle_block(self, pos):
+        self.touch(pos)
+        block = self.grid[pos]
+        self._track_block(block, -1)
+        block.cycle_states()
+        self._track_block(block, 1)
+        # Let grids that store block state themselves see the change
+        self.grid[pos] = block
+
+    def toggle_flipflop(self, block):
+        block.is_on = not block.is_on
+        self.flipflops_off += -1 if block.is_on else 1
+
+    def lock_block(self, pos, locked):
+        self.touch(pos)
+        block = self.grid[pos]
+        block.locked = locked
+        self.grid[pos] = block
 
     def grid_size(self):
+        if hasattr(self.grid, 'grid_size'):
+            return self.grid.grid_size()
+        if not self.grid:
+            return (0, 0)
         return tuple(n + 1 for n in map(max, zip(*self.grid.keys())))
 
     def start(self):
@@ -190,7 +346,7 @@ class Game(object):
         exit = None
         portals = set()
 
-        for pos, block in self.grid.items():
+        for pos, block in find_blocks(self.grid, (Launcher, Exit, Portal)):
             if isinstance(block, Launcher):
                 # TODO Shove balls into a list: there are may be multiple launchers, and thus balls
                 if ball is not None:
@@ -200,6 +356,7 @@ class Game(object):
                 if exit is not None:
                     raise Exception("must be a single exit")
                 exit = block
+                self.exit_pos = pos
             elif isinstance(block, Portal):
                 portals.add(pos)
 
@@ -213,6 +370,9 @@ class Game(object):
         for pos in portals:
             self.grid[pos].other_portals = tuple(portals - set((pos,)))
 
+        # The grid may have been edited behind our back before the start
+        self.count_flipflops()
+
         self._update_exit()
 
     def get_status(self):
@@ -237,20 +397,29 @@ class Game(object):
 
             block = self.grid.get(self.ball.pos)
             if block:
-                keep_moving = block.act(self.ball)
+                self.touch(self.ball.pos)
+                self.record(Log.ACT, self.ball.pos)
+                keep_moving = block.act(self, self.ball)
             else:
                 keep_moving = False
 
             self._update_exit()
 
+        ball = self.ball
+        self.record(Log.BALL, ball.pos, Ball.DIRECTIONS.index(ball.direction))
+        if ball.status != Ball.STATUS_ALIVE:
+            self.record(Log.STATUS, value=ball.status)
+
         self.step_n += 1
 
         return state
 
     def _update_exit(self):
-        # TODO Cache me, maybe
         if self.exit:
-            self.exit.is_on = all(ff.is_on for ff in self.grid.values() if isinstance(ff, FlipFlop))
+            is_on = self.flipflops_off == 0
+            if self.exit.is_on != is_on:
+                self.touch(self.exit_pos)
+                self.exit.is_on = is_on
 
 ALL_BLOCKS = (
     Launcher,
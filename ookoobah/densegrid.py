@@ -0,0 +1,266 @@
+"""Dense, array-backed grid.
+
+A drop-in replacement for the `{(x, y): block}` dict used by `core.Game`.
+Each cell is two bytes in typed arrays covering the bounding box of the
+grid: the block type (its position in `core.ALL_BLOCKS`, 0 for empty) and
+its state index << 1 | locked. Block objects are only created when a cell is
+looked up, and then kept so that changes made to them in place stick.
+Iterating over the grid hands out short-lived blocks for cells nobody has
+looked up yet, so a huge grid of walls never turns into a million objects.
+`iter_codes` goes one further and hands out the raw type and state bytes.
+
+Blocks that change themselves while the game runs are always kept, because
+the game holds on to them. Other blocks handed out by iteration must be
+changed through the grid (or the `core.Game` helpers), not in place.
+
+"""
+
+import re
+from array import array
+from collections import MutableMapping
+
+import core
+import levels
+
+CODES = dict((cls, code) for code, cls in enumerate(core.ALL_BLOCKS, 1))
+CLASSES = (None,) + core.ALL_BLOCKS
+
+# Blocks that the game changes in place, or keeps references to
+LIVE_BLOCKS = (core.FlipFlop, core.FlipFlopMirror, core.Exit, core.Portal)
+LIVE_CODES = frozenset(CODES[cls] for cls in LIVE_BLOCKS)
+
+FILLED = re.compile('[^\0]')
+
+# One block per (code, packed), handed out by `shared_block`
+SHARED = {}
+
+def pack(block):
+    """The state byte stored for `block`: its state index << 1 | locked."""
+    return levels.state_index(block) << 1 | bool(block.locked)
+
+def shared_block(code, packed):
+    """Return a block of the given type and state, shared by every caller.
+
+    Good for looking at (its colour, its character), never for changing.
+    """
+    block = SHARED.get((code, packed))
+    if block is None:
+        block = SHARED[code, packed] = levels.make_block(CLASSES[code], packed >> 1, bool(packed & 1))
+    return block
+
+def iter_codes(grid):
+    """Yield `(pos, code, packed)` for every block in `grid`.
+
+    `grid` is a `DenseGrid` or a plain dict. A DenseGrid answers from its
+    arrays, without making a block for each cell.
+    """
+    if isinstance(grid, DenseGrid):
+        return grid.iter_codes()
+    return ((pos, CODES[block.__class__], pack(block)) for pos, block in grid.iteritems())
+
+class DenseGrid (MutableMapping):
+    def __init__(self, grid=None):
+        self.x0 = self.y0 = 0
+        self.width = self.height = 0
+        self.types = array('B')
+        self.states = array('B')
+        self.blocks = {}
+        self.count = 0
+        self.min_x = self.min_y = self.max_x = self.max_y = None
+        # Set when a block on the edge of the bounds is deleted
+        self.bounds_stale = False
+        self.prototypes = {}
+
+        if grid:
+            for pos, block in grid.iteritems():
+                self.put(pos, block.__class__, levels.state_index(block), block.locked)
+
+    def _index(self, (x, y)):
+        x -= self.x0
+        y -= self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return None
+
+    def _pos(self, idx):
+        return (self.x0 + idx % self.width, self.y0 + idx // self.width)
+
+    def _grow(self, (x, y)):
+        if not self.width:
+            x0, y0, x1, y1 = x, y, x + 1, y + 1
+        else:
+            x0, y0 = self.x0, self.y0
+            x1, y1 = x0 + self.width, y0 + self.height
+            # Grow geometrically, so that filling a grid cell by cell stays linear
+            if x < x0:
+                x0 = min(x, x0 - self.width)
+            if x >= x1:
+                x1 = max(x + 1, x1 + self.width)
+            if y < y0:
+                y0 = min(y, y0 - self.height)
+            if y >= y1:
+                y1 = max(y + 1, y1 + self.height)
+
+        width, height = x1 - x0, y1 - y0
+        types = array('B', [0]) * (width * height)
+        states = array('B', [0]) * (width * height)
+        for row in range(self.height):
+            src = row * self.width
+            dst = (row + self.y0 - y0) * width + self.x0 - x0
+            types[dst:dst + self.width] = self.types[src:src + self.width]
+            states[dst:dst + self.width] = self.states[src:src + self.width]
+
+        self.x0, self.y0 = x0, y0
+        self.width, self.height = width, height
+        self.types, self.states = types, states
+
+    def _make(self, code, packed):
+        try:
+            proto = self.prototypes[code, packed]
+        except KeyError:
+            block_class = CLASSES[code]
+            proto = block_class, levels.make_block(block_class, packed >> 1, bool(packed & 1)).__dict__
+            self.prototypes[code, packed] = proto
+        block_class, attrs = proto
+        block = block_class.__new__(block_class)
+        block.__dict__.update(attrs)
+        return block
+
+    def put(self, pos, block_class, state_idx=0, locked=True):
+        """Store a block by type and state, without creating an object."""
+        idx = self._index(pos)
+        if idx is None:
+            self._grow(pos)
+            idx = self._index(pos)
+
+        if not self.types[idx]:
+            self.count += 1
+            x, y = pos
+            if self.min_x is None:
+                self.min_x, self.min_y, self.max_x, self.max_y = x, y, x, y
+            else:
+                self.min_x = min(self.min_x, x)
+                self.min_y = min(self.min_y, y)
+                self.max_x = max(self.max_x, x)
+                self.max_y = max(self.max_y, y)
+
+        self.types[idx] = CODES[block_class]
+        self.states[idx] = state_idx << 1 | bool(locked)
+        self.blocks.pop(pos, None)
+
+    def __setitem__(self, pos, block):
+        self.put(pos, block.__class__, levels.state_index(block), block.locked)
+        self.blocks[pos] = block
+
+    def __getitem__(self, pos):
+        block = self.blocks.get(pos)
+        if block is not None:
+            return block
+
+        idx = self._index(pos)
+        if idx is None or not self.types[idx]:
+            raise KeyError(pos)
+
+        block = self.blocks[pos] = self._make(self.types[idx], self.states[idx])
+        return block
+
+    def __delitem__(self, pos):
+        idx = self._index(pos)
+        if idx is None or not self.types[idx]:
+            raise KeyError(pos)
+        self.types[idx] = 0
+        self.states[idx] = 0
+        self.blocks.pop(pos, None)
+        self.count -= 1
+
+        x, y = pos
+        if x in (self.min_x, self.max_x) or y in (self.min_y, self.max_y):
+            self.bounds_stale = True
+
+    def __contains__(self, pos):
+        idx = self._index(pos)
+        return idx is not None and self.types[idx] != 0
+
+    def __len__(self):
+        return self.count
+
+    def _filled(self):
+        return (match.start() for match in FILLED.finditer(self.types.tostring()))
+
+    def __iter__(self):
+        for idx in self._filled():
+            yield self._pos(idx)
+
+    def _block_at(self, idx, pos):
+        block = self.blocks.get(pos)
+        if block is None:
+            code = self.types[idx]
+            block = self._make(code, self.states[idx])
+            if code in LIVE_CODES:
+                self.blocks[pos] = block
+        return block
+
+    def iteritems(self):
+        for idx in self._filled():
+            pos = self._pos(idx)
+            yield pos, self._block_at(idx, pos)
+
+    def iter_codes(self):
+        """Yield `(pos, code, packed)` for every block, in row order.
+
+        `code` is the block type (see `CODES`) and `packed` its state index
+        << 1 | locked. Blocks changed in place are read back.
+        """
+        types, states, blocks = self.types, self.states, self.blocks
+        for idx in self._filled():
+            pos = self._pos(idx)
+            block = blocks.get(pos)
+            yield pos, types[idx], states[idx] if block is None else pack(block)
+
+    def itervalues(self):
+        for pos, block in self.iteritems():
+            yield block
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def find(self, block_classes):
+        """Yield `(pos, block)` for the blocks that are instances of `block_classes`."""
+        data = self.types.tostring()
+        hits = []
+        for block_class, code in CODES.iteritems():
+            if issubclass(block_class, block_classes):
+                char = chr(code)
+                idx = data.find(char)
+                while idx != -1:
+                    hits.append(idx)
+                    idx = data.find(char, idx + 1)
+
+        for idx in sorted(hits):
+            pos = self._pos(idx)
+            yield pos, self._block_at(idx, pos)
+
+    def bounds(self):
+        """Return `(min_x, min_y, max_x, max_y)` of the filled cells.
+
+        Deleting a block on the edge only marks the bounds stale; they are
+        worked out again here, on the next call.
+        """
+        if self.bounds_stale:
+            self.bounds_stale = False
+            self.min_x = self.min_y = self.max_x = self.max_y = None
+            positions = [self._pos(idx) for idx in self._filled()]
+            if positions:
+                xs, ys = zip(*positions)
+                self.min_x, self.min_y, self.max_x, self.max_y = min(xs), min(ys), max(xs), max(ys)
+        return self.min_x, self.min_y, self.max_x, self.max_y
+
+    def grid_size(self):
+        """Return `(max_x + 1, max_y + 1)`, or `(0, 0)` when empty."""
+        if not self.count:
+            return (0, 0)
+        min_x, min_y, max_x, max_y = self.bounds()
+        return (max_x + 1, max_y + 1)
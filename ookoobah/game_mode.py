@@ -1,14 +1,14 @@
 from __future__ import division
-import sys
 import os
 import pyglet
-import pickle
 from pyglet.gl import *
 from pyglet.window import key, mouse
 from euclid import Vector3
 import mode
 import core
 import session
+import levels
+import levelcache
 import render
 import gui
 from tools import *
@@ -16,6 +16,7 @@ from glutil import *
 from camera import Camera
 from text_float import TextFloat
 import sounds
+from profiling import profiler
 
 LEVELS = (
     "intro-basics",
@@ -35,6 +36,19 @@ LEVELS = (
     "maze",
 )
 
+def get_level_filename(level_name):
+    data_dir = os.path.join(pyglet.resource.get_script_home(), 'data')
+    return os.path.join(data_dir, level_name + '.level')
+
+EVENT_SOUNDS = {
+    core.Game.EVENT_WALL: 'wall.wav',
+    core.Game.EVENT_MIRROR: 'mirror.wav',
+    core.Game.EVENT_FLIP_ON: 'flip-on.wav',
+    core.Game.EVENT_FLIP_OFF: 'flip-off.wav',
+    core.Game.EVENT_PORTAL: 'portal.wav',
+    core.Game.EVENT_VICTORY: 'victory.wav',
+}
+
 class GameMode(mode.Mode):
     name = "game_mode"
 
@@ -42,10 +56,14 @@ class GameMode(mode.Mode):
     SLOW_START = 120
     FPS_FONT_SIZE = 10
 
-    def __init__(self, editor_mode=True, level_name=None):
+    def __init__(self, editor_mode=True, level_name=None, offscreen=False, preloader=None):
         super(GameMode, self).__init__()
         self.editor_mode = editor_mode
         self.level_name = level_name
+        # Rendering for screenshots: no help, no FPS, same game every run
+        self.offscreen = offscreen
+        # A levelcache.Preloader that may have this level ready
+        self.preloader = preloader
 
     def connect(self, controller):
         super(GameMode, self).connect(controller)
@@ -64,22 +82,28 @@ class GameMode(mode.Mode):
         if not self.level_name:
             self.level_name = self.get_default_level_name()
 
+        self.prepared = None
         grid, level_help = self.load_grid_from_file(self.level_name)
-        self.game_session = session.Session(grid)
+        self.game_session = session.Session(grid, 0 if self.offscreen else None)
+        self.game_session.game.events = []
         self.game_status = None
         self.level_help = None
         self.charge_player = None
 
-        if level_help and not self.editor_mode:
+        if level_help and not self.editor_mode and not self.offscreen:
             level_help += '\n\nClick to continue.\n'
             font = gui.GameMenuFont()
             self.level_help = TextFloat(level_help, 0, -200, 500, font.name, 12)
 
         self.init_level()
-        self.init_renderer()
         self.init_gui()
         self.init_camera()
 
+        self.preloader = None
+        next_level_name = self.get_next_level_name()
+        if not self.editor_mode and not self.offscreen and next_level_name:
+            self.preloader = levelcache.Preloader(self.get_level_filename(next_level_name))
+
     def init_camera(self):
         grid = self.game_session.game.grid
         if grid:
@@ -127,7 +151,9 @@ class GameMode(mode.Mode):
         glDisable(GL_DEPTH_TEST)
 
     def init_renderer(self):
-        self.renderer = render.GameRenderer(self.game_session.game)
+        # Renderers made by the preloader are only good for the first time
+        self.renderer = render.GameRenderer(self.game_session.game, self.prepared)
+        self.prepared = None
 
     def delete_renderer(self):
         if self.renderer:
@@ -176,11 +202,11 @@ class GameMode(mode.Mode):
             sounds.play('boom.wav', 0.4)
         self.game_status = new_status
 
-        if not self.editor_mode:
+        if not self.editor_mode and not self.offscreen:
             if new_status == core.Game.STATUS_VICTORY or self.skip_level:
                 next_level_name = self.level_name if self.editor_mode else self.get_next_level_name()
                 if next_level_name:
-                    self.control.switch_handler("game_mode", False, next_level_name)
+                    self.control.switch_handler("game_mode", False, next_level_name, preloader=self.preloader)
                     return
                 elif not self.game_complete:
                     self.gui.show_popup("Congrats! You completed the game!")
@@ -195,6 +221,8 @@ class GameMode(mode.Mode):
             self.game_session.step()
             self.next_step = self.time + self.STEP_SIZE # / (self.game_session.game.speed + 1)
 
+        self.play_events()
+
         cam_idx = 2 if self.keys[key.LSHIFT] or self.keys[key.RSHIFT] else 1
         cam_pos = self.camera.eye.next_value
         if self.keys[key.UP]:
@@ -211,7 +239,15 @@ class GameMode(mode.Mode):
         cam_pos.z = min(40, max(5, cam_pos.z))
 
         self.camera.tick()
-        self.renderer.tick()
+        with profiler.section('renderer.tick'):
+            self.renderer.tick()
+
+    def play_events(self):
+        # Several blocks in one frame still make a single sound each
+        events = self.game_session.game.events
+        for event in set(events):
+            sounds.play(EVENT_SOUNDS[event])
+        del events[:]
 
     def stop_charge_player(self):
         if self.charge_player:
@@ -235,12 +271,14 @@ class GameMode(mode.Mode):
 
         self.update_mouse()
 
-        self.renderer.draw(self.tool.draw_locks)
+        with profiler.section('batch.draw'):
+            self.renderer.draw(self.tool.draw_locks)
 
         with gl_disable(GL_LIGHTING, GL_DEPTH_TEST):
             with gl_ortho(self.window):
                 self.gui.draw()
-                self.fps_magic.draw()
+                if not self.offscreen:
+                    self.fps_magic.draw()
                 if self.level_help:
                     self.level_help.draw(self.window)
 
@@ -331,12 +369,12 @@ class GameMode(mode.Mode):
         self.save_level(self.level_name)
 
     def get_default_level_name(self):
-        return sys.argv[1] if len(sys.argv) > 1 else LEVELS[0]
+        return self.control.level_name or LEVELS[0]
 
     def get_next_level_name(self):
         # Always stay on the same level if the level was specified on the command line
-        if len(sys.argv) > 1:
-            return sys.argv[1]
+        if self.control.level_name:
+            return self.control.level_name
 
         current_level_index = LEVELS.index(self.level_name)
         if current_level_index >= 0 and current_level_index < len(LEVELS) - 1:
@@ -346,19 +384,23 @@ class GameMode(mode.Mode):
 
     def save_level(self, level_name):
         level_filename = self.get_level_filename(level_name)
-        with open(level_filename, 'w+') as level_file:
-            pickle.dump(self.game_session.game.grid, level_file)
+        with open(level_filename, 'wb') as level_file:
+            levels.save(self.game_session.game.grid, level_file)
+        levelcache.cache.forget(level_filename)
         self.gui.show_popup('Saved')
 
     def load_grid_from_file(self, level_name):
         grid = {}
         level_filename = self.get_level_filename(level_name)
-        try:
-            with open(level_filename, 'r') as level_file:
-                grid = pickle.load(level_file)
-        except IOError:
-            if not self.editor_mode:
-                raise
+        preloaded = self.preloader and self.preloader.filename == level_filename and self.preloader.get()
+        if preloaded:
+            grid, self.prepared = preloaded
+        else:
+            try:
+                grid = levelcache.cache.get_grid(level_filename)
+            except EnvironmentError:
+                if not self.editor_mode:
+                    raise
 
         level_help = None
         try:
@@ -382,11 +424,10 @@ class GameMode(mode.Mode):
 
         if self.renderer:
             self.renderer.delete()
-        self.renderer = render.GameRenderer(self.game_session.game)
+        self.init_renderer()
 
     def get_level_filename(self, level_name):
-        data_dir = os.path.join(pyglet.resource.get_script_home(), 'data')
-        return os.path.join(data_dir, level_name + '.level')
+        return get_level_filename(level_name)
 
     def get_data_dir(self):
         return pyglet.resource.path[0]
@@ -8,6 +8,7 @@ from pyglet.window import mouse, key
 from pyglet.gl import *
 from euclid import Vector2
 from spring import Spring
+from profiling import profiler
 
 DONE = object()
 BACK = object()
@@ -115,6 +116,10 @@ class Manager (object):
             btn.target = Vector2(self.MARGIN * (len(self.stack) + 1), offset)
 
     def tick(self, dt=None):
+        with profiler.section('gui.tick'):
+            self._tick()
+
+    def _tick(self):
         self.buttons = [b for b in self.buttons if b.tick() is not DONE]
 
         if self.popup and self.popup.tick() is DONE:
@@ -125,13 +130,14 @@ class Manager (object):
             self.popup = Popup(text, color)
 
     def draw(self):
-        glPushMatrix()
-        glTranslatef(0, self.window.height, 0)
-        [btn.draw() for btn in self.buttons]
-        glPopMatrix()
-
-        if self.popup:
-            self.popup.draw(self.window)
+        with profiler.section('gui.draw'):
+            glPushMatrix()
+            glTranslatef(0, self.window.height, 0)
+            [btn.draw() for btn in self.buttons]
+            glPopMatrix()
+
+            if self.popup:
+                self.popup.draw(self.window)
 
     def on_mouse_release(self, x, y, btn, mods):
         if not self.active:
@@ -0,0 +1,107 @@
+"""Headless level simulation.
+
+Runs games to completion without a window, sound or pyglet. Every step the
+full game state is hashed, so a level where the ball bounces around forever
+is reported as soon as a state repeats instead of burning the step budget.
+Likewise, a ball that has left the bounding box of the grid has nothing
+left to turn it around, so it is reported lost right away.
+
+"""
+
+import core
+
+STATUS_INVALID = "invalid"
+STATUS_LOOP = "loop"
+STATUS_TIMEOUT = "timeout"
+
+MAX_STEPS = 10000
+
+class Result(object):
+    """Outcome of a headless run.
+
+    `status` is one of the `core.Game` statuses, or `STATUS_LOOP`,
+    `STATUS_TIMEOUT` or `STATUS_INVALID`. For loops `loop_start` is the step
+    at which the repeated state was first seen.
+    """
+
+    def __init__(self, status, steps, loop_start=None, error=None):
+        self.status = status
+        self.steps = steps
+        self.loop_start = loop_start
+        self.error = error
+
+    @property
+    def loops_forever(self):
+        return self.status == STATUS_LOOP
+
+    def __repr__(self):
+        return 'Result(%r, %r, loop_start=%r, error=%r)' % (self.status, self.steps, self.loop_start, self.error)
+
+class StateKey(object):
+    """Hashes the parts of a started game that can change while it runs.
+
+    Only the ball, flip-flops and flip-flop mirrors change state during a
+    run; everything else is fixed once the game has started.
+    """
+
+    def __init__(self, game):
+        self.flipflops = tuple(block for pos, block in sorted(core.find_blocks(game.grid, core.FlipFlop)))
+        self.mirrors = tuple(block for pos, block in sorted(core.find_blocks(game.grid, core.FlipFlopMirror)))
+
+    def __call__(self, game):
+        ball = game.ball
+        return (
+            ball.pos,
+            ball.direction,
+            tuple(ff.is_on for ff in self.flipflops),
+            tuple(m.slope for m in self.mirrors),
+        )
+
+def is_deterministic(game):
+    """Return True if the started game can only play out one way.
+
+    Portals pick their destination at random when there are more than two of
+    them. Even with a seeded game the random generator moves on, so a
+    repeated state does not mean the game repeats.
+    """
+    return all(len(block.other_portals) < 2
+        for pos, block in core.find_blocks(game.grid, core.Portal))
+
+def run_game(game, max_steps=MAX_STEPS):
+    """Start `game` and step it until it is over, loops or runs out of steps."""
+    try:
+        game.start()
+    except Exception as e:
+        return Result(STATUS_INVALID, 0, error=str(e))
+
+    key = StateKey(game) if is_deterministic(game) else None
+    seen = {}
+    min_x, min_y, max_x, max_y = core.get_bounds(game.grid)
+
+    status = game.get_status()
+    while status == core.Game.STATUS_ON:
+        x, y = game.ball.pos
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            # Blocks don't move during a run, so the ball only gets further away
+            return Result(core.Game.STATUS_DEFEAT, game.step_n)
+
+        if game.step_n >= max_steps:
+            return Result(STATUS_TIMEOUT, game.step_n)
+
+        if key:
+            state = key(game)
+            first = seen.setdefault(state, game.step_n)
+            if first != game.step_n:
+                return Result(STATUS_LOOP, game.step_n, loop_start=first)
+
+        game.step()
+        status = game.get_status()
+
+    return Result(status, game.step_n)
+
+def run(grid, max_steps=MAX_STEPS, seed=None):
+    """Simulate a level grid. The blocks in `grid` are modified by the run."""
+    return run_game(core.Game(grid, seed), max_steps)
+
+def run_many(grids, max_steps=MAX_STEPS, seed=None):
+    return [run(grid, max_steps, seed) for grid in grids]
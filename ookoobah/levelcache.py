@@ -0,0 +1,152 @@
+"""Cache of parsed levels and their thumbnails.
+
+A level file is parsed once and kept for as long as its modification time
+and size stay the same. `get_grid` hands out fresh blocks every time, so a
+game can change them freely. `warm` fills the cache from a background thread
+while the player is busy with something else, and `Preloader` goes one step
+further for the level that comes next.
+
+Thumbnails are top-down pictures of a level with one square per block, in
+the block's colour. They are made on the CPU as `pyglet.image.ImageData`;
+the texture is only uploaded once the thumbnail is drawn.
+
+"""
+
+import os
+import threading
+
+import pyglet
+
+import densegrid
+import levels
+import render
+
+THUMBNAIL_CELL = 4
+
+def copy_grid(grid):
+    """Copy a grid and its blocks, without going through the block constructors."""
+    copy = {}
+    for pos, block in grid.iteritems():
+        new = block.__class__.__new__(block.__class__)
+        new.__dict__.update(block.__dict__)
+        copy[pos] = new
+    return copy
+
+def block_color(block):
+    renderer = render.CORE_MAPPING.get(block.__class__)
+    if renderer is None:
+        return (.5, .5, .5)
+    if hasattr(renderer, 'colors'):
+        return renderer.colors[block.is_on][:3]
+    return tuple(renderer.color[:3])
+
+def make_thumbnail(grid, cell=THUMBNAIL_CELL):
+    if not grid:
+        return None
+
+    cells = list(densegrid.iter_codes(grid))
+    xs = [x for (x, y), code, packed in cells]
+    ys = [y for (x, y), code, packed in cells]
+    min_x, min_y = min(xs), min(ys)
+    width = (max(xs) - min_x + 1) * cell
+    height = (max(ys) - min_y + 1) * cell
+
+    data = bytearray(width * height * 4)
+    rows = {}
+    for (x, y), code, packed in cells:
+        row = rows.get((code, packed))
+        if row is None:
+            color = block_color(densegrid.shared_block(code, packed))
+            row = rows[code, packed] = (bytearray(int(c * 255) for c in color) + '\xff') * cell
+        for line in range((y - min_y) * cell, (y - min_y + 1) * cell):
+            start = (line * width + (x - min_x) * cell) * 4
+            data[start:start + len(row)] = row
+
+    return pyglet.image.ImageData(width, height, 'RGBA', str(data))
+
+class Entry (object):
+    def __init__(self, key, grid):
+        self.key = key
+        self.grid = grid
+        self.thumbnail = make_thumbnail(grid)
+
+class LevelCache (object):
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, filename):
+        stat = os.stat(filename)
+        return (stat.st_mtime, stat.st_size)
+
+    def get_entry(self, filename):
+        key = self.get_key(filename)
+        with self.lock:
+            entry = self.entries.get(filename)
+        if entry is None or entry.key != key:
+            with open(filename, 'rb') as level_file:
+                entry = Entry(key, levels.load(level_file))
+            with self.lock:
+                self.entries[filename] = entry
+        return entry
+
+    def get_grid(self, filename):
+        """Return a fresh copy of the level in `filename`."""
+        return copy_grid(self.get_entry(filename).grid)
+
+    def get_thumbnail(self, filename):
+        return self.get_entry(filename).thumbnail
+
+    def peek_thumbnail(self, filename):
+        """Return the thumbnail if the level is cached, without loading it."""
+        with self.lock:
+            entry = self.entries.get(filename)
+        return entry and entry.thumbnail
+
+    def forget(self, filename):
+        with self.lock:
+            self.entries.pop(filename, None)
+
+    def warm(self, filenames):
+        """Load `filenames` into the cache from a background thread."""
+        thread = threading.Thread(target=self._warm, args=(list(filenames),))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _warm(self, filenames):
+        for filename in filenames:
+            try:
+                self.get_entry(filename)
+            except EnvironmentError:
+                pass
+
+cache = LevelCache()
+
+class Preloader (object):
+    """Loads a level and makes its renderers on a worker thread.
+
+    What is left for the main thread is uploading the vertex data, see
+    `render.GridRenderer`.
+    """
+
+    def __init__(self, filename, cache=cache):
+        self.filename = filename
+        self.cache = cache
+        self.result = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            grid = self.cache.get_grid(self.filename)
+            self.result = grid, render.prepare_grid(grid)
+        except Exception:
+            # Leave it to the normal loading to report the problem
+            self.result = None
+
+    def get(self):
+        """Wait for the worker; return `(grid, prepared renderers)` or None."""
+        self.thread.join()
+        return self.result
@@ -0,0 +1,105 @@
+"""Level file format.
+
+Levels are stored in a small binary format, all numbers little endian:
+
+    header   "OOKL", format version (u8), number of block types (u8)
+    types    per type: length (u8) and name of the block class in core
+    blocks   number of blocks (u32), then per block:
+             x, y (s16), type index (u8), state index << 1 | locked (u8)
+
+Blocks are rebuilt from the class name and the index into their
+`all_states`, so renaming or reorganising the block classes only needs the
+name table below to be kept in sync. Levels saved before this format existed
+are pickled grids; those still load.
+
+"""
+
+import pickle
+import struct
+
+import core
+
+MAGIC = 'OOKL'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBB')
+COUNT = struct.Struct('<I')
+BLOCK = struct.Struct('<hhBB')
+
+BLOCK_TYPES = dict((cls.__name__, cls) for cls in core.ALL_BLOCKS)
+
+class Error (Exception):
+    pass
+
+def state_index(block):
+    """Index into `all_states` matching the block's current attributes.
+
+    Blocks toggled by the game (flip-flops) don't keep `all_states_idx` up to
+    date, so look at the attributes first.
+    """
+    for idx, state in enumerate(block.all_states):
+        if all(getattr(block, k, None) == v for k, v in state):
+            return idx
+    return max(block.all_states_idx, 0)
+
+def make_block(block_class, state_idx, locked):
+    block = block_class()
+    if state_idx:
+        block.all_states_idx = state_idx - 1
+        block.cycle_states()
+    block.locked = locked
+    return block
+
+def dumps(grid):
+    types = []
+    type_idx = {}
+    blocks = []
+
+    for (x, y), block in sorted(grid.items()):
+        name = block.__class__.__name__
+        if name not in type_idx:
+            type_idx[name] = len(types)
+            types.append(name)
+        blocks.append(BLOCK.pack(x, y, type_idx[name], state_index(block) << 1 | bool(block.locked)))
+
+    data = [HEADER.pack(MAGIC, VERSION, len(types))]
+    data.extend(chr(len(name)) + name for name in types)
+    data.append(COUNT.pack(len(blocks)))
+    data.extend(blocks)
+    return ''.join(data)
+
+def loads(data):
+    if not data.startswith(MAGIC):
+        # Old level: a pickled grid
+        return pickle.loads(data)
+
+    magic, version, type_count = HEADER.unpack_from(data)
+    if version > VERSION:
+        raise Error("level format version %d is newer than %d" % (version, VERSION))
+
+    offset = HEADER.size
+    types = []
+    for _ in range(type_count):
+        length = ord(data[offset])
+        name = data[offset + 1:offset + 1 + length]
+        offset += 1 + length
+        try:
+            types.append(BLOCK_TYPES[name])
+        except KeyError:
+            raise Error("unknown block type %r" % name)
+
+    count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+
+    grid = {}
+    for _ in range(count):
+        x, y, type_idx, packed = BLOCK.unpack_from(data, offset)
+        offset += BLOCK.size
+        grid[x, y] = make_block(types[type_idx], packed >> 1, bool(packed & 1))
+    return grid
+
+def load(level_file):
+    return loads(level_file.read())
+
+def save(grid, level_file):
+    level_file.write(dumps(grid))
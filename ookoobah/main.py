@@ -7,6 +7,9 @@ imported.
 
 from __future__ import division
 
+import os
+import timeit
+
 from pyglet import app
 from pyglet import clock
 from pyglet import window
@@ -18,6 +21,8 @@ import mode
 import game_mode
 import menu_mode
 import sounds
+import offscreen
+from profiling import profiler, Overlay, wrap_dispatch
 
 class Controller(object):
     """Top level controller object.
@@ -32,9 +37,12 @@ class Controller(object):
 
     """
 
-    def __init__(self):
+    def __init__(self, profile=None, level_name=None):
         self._handler = None
         self.suspended = {}
+        self.profile = profile
+        # The level given on the command line, if any
+        self.level_name = level_name
 
     def get_handler(self):
         return self._handler
@@ -110,10 +118,14 @@ class Controller(object):
         """Update the game logic.
 
         """
-        self.gui.tick()
+        profiler.end_frame()
 
-        if self.handler is not None:
-            self.handler.tick()
+        with profiler.section('controller.tick'):
+            self.gui.tick()
+
+            if self.handler is not None:
+                with profiler.section('mode.tick'):
+                    self.handler.tick()
 
     def setup_gl(self):
         """Configure GL properties.
@@ -132,11 +144,54 @@ class Controller(object):
         """
         self.window = window.Window(width=800, height=600, visible=False, caption="Ookoobah", resizable=True, fullscreen=False)
         self.window.set_fullscreen(True)
+        # Pushed first, so that the overlay draws over every mode
+        self.window.push_handlers(Overlay(self.window))
+        wrap_dispatch(self.window)
         self.gui = gui.Manager(self.window)
         clock.schedule_interval_soft(self.tick, 1 / 60)
 
         sounds.load()
 
+    def render_offscreen(self, level_name, frames, output=None, size=(800, 600)):
+        """Play a level into an offscreen framebuffer.
+
+        Nothing is shown and no sound is played. The level is played for
+        `frames` ticks, each followed by a draw. If `output` is given, every
+        frame is saved there as a PNG image.
+
+        :rtype: list of float
+        :return: Seconds spent ticking and drawing each frame.
+
+        """
+        width, height = size
+        self.window = window.Window(width=width, height=height, visible=False, caption="Ookoobah")
+        self.gui = gui.Manager(self.window)
+        self.setup_gl()
+
+        self.level_name = level_name
+        framebuffer = offscreen.Framebuffer(width, height)
+        framebuffer.bind()
+        self.switch_handler("game_mode", False, level_name, offscreen=True)
+
+        times = []
+        try:
+            for frame in range(frames):
+                start = timeit.default_timer()
+                self.tick(1 / 60)
+                self.window.dispatch_event('on_draw')
+                glFinish()
+                times.append(timeit.default_timer() - start)
+
+                if output:
+                    framebuffer.save(os.path.join(output, '%s-%04d.png' % (level_name, frame)))
+        finally:
+            self.clear_handler()
+            framebuffer.unbind()
+            framebuffer.delete()
+            self.window.close()
+
+        return times
+
     def run(self):
         """Start the game.
 
@@ -145,14 +200,41 @@ class Controller(object):
         self.setup_gl()
         self.switch_handler("menu_mode")
         self.window.set_visible()
-        app.run()
+        if self.profile:
+            profiler.start()
+        try:
+            app.run()
+        finally:
+            if self.profile:
+                profiler.dump(self.profile)
 
 
 ## Main function
 ################
 
-def main():
+def main(profile=None, level_name=None):
     """Start the game.
 
+    :Parameters:
+        `profile` : str
+            If given, frame times are recorded and written to this file
+            (JSON if it ends in .json, otherwise CSV) when the game exits.
+        `level_name` : str
+            If given, only this level is played or edited.
+
+    """
+    Controller(profile, level_name).run()
+
+def render(level_name, frames, output=None, size=(800, 600)):
+    """Render a level offscreen and print the frame times.
+
+    See `Controller.render_offscreen`.
+
     """
-    Controller().run()
+    times = Controller().render_offscreen(level_name, frames, output, size)
+    for frame, elapsed in enumerate(times):
+        print "%5d %8.3f ms" % (frame, elapsed * 1000)
+    if not times:
+        return
+    print "%d frames, mean %.3f ms, min %.3f ms, max %.3f ms" % (len(times),
+        sum(times) / len(times) * 1000, min(times) * 1000, max(times) * 1000)
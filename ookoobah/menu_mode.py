@@ -6,10 +6,15 @@ from pyglet.gl import *
 from pyglet.window import key
 import mode
 import gui
+import levelcache
+from game_mode import LEVELS, get_level_filename
 
 class MenuMode(mode.Mode):
     name = "menu_mode"
 
+    PREVIEW_SIZE = 40
+    PREVIEW_SPACING = 8
+
     def connect(self, controller):
         super(MenuMode, self).connect(controller)
         self.init_opengl()
@@ -17,8 +22,30 @@ class MenuMode(mode.Mode):
         self.bg = pyglet.sprite.Sprite(pyglet.resource.image('menu-bg.png'))
         glClearColor(20/255, 20/255, 20/255, 1)
 
+        self.level_files = [get_level_filename(name) for name in LEVELS]
+        levelcache.cache.warm(self.level_files)
+        self.previews = [None] * len(self.level_files)
+        self.preview_batch = pyglet.graphics.Batch()
+
     def disconnect(self):
         self.bg.delete()
+        for sprite in self.previews:
+            if sprite:
+                sprite.delete()
+
+    def update_previews(self):
+        """Make sprites for the level thumbnails loaded so far."""
+        for idx, filename in enumerate(self.level_files):
+            if self.previews[idx]:
+                continue
+            image = levelcache.cache.peek_thumbnail(filename)
+            if not image:
+                continue
+            sprite = pyglet.sprite.Sprite(image, batch=self.preview_batch)
+            sprite.scale = min(self.PREVIEW_SIZE / image.width, self.PREVIEW_SIZE / image.height)
+            sprite.x = self.PREVIEW_SPACING + idx * (self.PREVIEW_SIZE + self.PREVIEW_SPACING)
+            sprite.y = self.PREVIEW_SPACING
+            self.previews[idx] = sprite
 
     @property
     def full_screen_label(self):
@@ -30,7 +57,7 @@ class MenuMode(mode.Mode):
         self.b_fullscreen = gui.Button(self.full_screen_label, font2, self.on_toggle_full_screen)
 
         buttons = []
-        if len(sys.argv) > 1:
+        if self.control.level_name:
             buttons.append(gui.Button('Play', font, self.on_play_pressed))
             buttons.append(gui.Button('Edit', font, self.on_edit_pressed))
         else:
@@ -61,6 +88,8 @@ class MenuMode(mode.Mode):
         self.window.clear()
         self.bg.x = self.window.width - self.bg.width
         self.bg.draw()
+        self.update_previews()
+        self.preview_batch.draw()
         self.gui.draw()
 
     def init_opengl(self):
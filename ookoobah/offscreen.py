@@ -0,0 +1,75 @@
+"""Offscreen rendering.
+
+Renders into a framebuffer object instead of the window, so that frames can
+be timed and saved as images without anything showing on screen. This still
+needs a GL context with EXT_framebuffer_object: the window that provides it
+stays hidden, and on machines without a screen a virtual display server
+(such as Xvfb) will do.
+
+"""
+
+from __future__ import division
+
+from ctypes import byref
+
+import pyglet
+from pyglet.gl import *
+
+class Error (Exception):
+    pass
+
+class Framebuffer (object):
+    def __init__(self, width, height):
+        if not gl_info.have_extension('GL_EXT_framebuffer_object'):
+            raise Error("framebuffer objects are not supported")
+
+        self.width = width
+        self.height = height
+
+        self.fbo = GLuint()
+        self.color = GLuint()
+        self.depth = GLuint()
+        glGenFramebuffersEXT(1, byref(self.fbo))
+        glGenRenderbuffersEXT(1, byref(self.color))
+        glGenRenderbuffersEXT(1, byref(self.depth))
+
+        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT, self.color)
+        glRenderbufferStorageEXT(GL_RENDERBUFFER_EXT, GL_RGBA8, width, height)
+        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT, self.depth)
+        glRenderbufferStorageEXT(GL_RENDERBUFFER_EXT, GL_DEPTH_COMPONENT24, width, height)
+        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT, 0)
+
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbo)
+        glFramebufferRenderbufferEXT(GL_FRAMEBUFFER_EXT, GL_COLOR_ATTACHMENT0_EXT, GL_RENDERBUFFER_EXT, self.color)
+        glFramebufferRenderbufferEXT(GL_FRAMEBUFFER_EXT, GL_DEPTH_ATTACHMENT_EXT, GL_RENDERBUFFER_EXT, self.depth)
+        status = glCheckFramebufferStatusEXT(GL_FRAMEBUFFER_EXT)
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
+
+        if status != GL_FRAMEBUFFER_COMPLETE_EXT:
+            self.delete()
+            raise Error("framebuffer is incomplete: 0x%x" % status)
+
+    def bind(self):
+        """Render into the framebuffer until `unbind`."""
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def unbind(self):
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
+
+    def get_image(self):
+        """Read the bound framebuffer back as `pyglet.image.ImageData`."""
+        data = (GLubyte * (self.width * self.height * 4))()
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, data)
+        return pyglet.image.ImageData(self.width, self.height, 'RGBA', data)
+
+    def save(self, filename):
+        self.get_image().save(filename)
+
+    def delete(self):
+        if self.fbo:
+            glDeleteFramebuffersEXT(1, byref(self.fbo))
+            glDeleteRenderbuffersEXT(1, byref(self.color))
+            glDeleteRenderbuffersEXT(1, byref(self.depth))
+            self.fbo = self.color = self.depth = GLuint()
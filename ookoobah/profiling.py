@@ -0,0 +1,204 @@
+"""Frame time profiler.
+
+Times named sections of each frame, to see where the frame budget goes:
+
+    with profiler.section('renderer.tick'):
+        self.renderer.tick()
+
+The controller calls `end_frame` once per tick. While the profiler is off a
+section costs a flag check. Recorded frames can be dumped as CSV or JSON,
+and `Overlay` shows running averages on top of the game (F3 toggles it).
+
+Allocations are counted with the garbage collector's generation 0 counter:
+objects tracked by the collector (lists, dicts, instances...) created minus
+those freed during the frame. Floats and strings are not counted.
+
+"""
+
+from __future__ import division
+
+import gc
+import csv
+import json
+import timeit
+from collections import deque
+
+import pyglet
+from pyglet.gl import *
+from pyglet.window import key
+
+from glutil import *
+
+FRAME = 'frame'
+ALLOCATIONS = 'allocations'
+
+MAX_FRAMES = 60 * 60 * 10
+
+timer = timeit.default_timer
+
+class Section (object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.depth = 0
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            # Only the outermost of nested entries is timed
+            if not self.depth:
+                self.start = timer()
+            self.depth += 1
+
+    def __exit__(self, *exc_info):
+        if self.depth:
+            self.depth -= 1
+            if not self.depth:
+                self.profiler.add(self.name, timer() - self.start)
+
+class Profiler (object):
+    def __init__(self):
+        self.enabled = False
+        self.frames = deque(maxlen=MAX_FRAMES)
+        self.names = []
+        self.sections = {}
+        self.times = {}
+        self.frame_start = None
+        self.gc_count = None
+
+    def section(self, name):
+        try:
+            return self.sections[name]
+        except KeyError:
+            section = self.sections[name] = Section(self, name)
+            return section
+
+    def add(self, name, elapsed):
+        if name not in self.times:
+            self.times[name] = 0
+            if name not in self.names:
+                self.names.append(name)
+        self.times[name] += elapsed
+
+    def start(self):
+        self.enabled = True
+        self.times = {}
+        self.frame_start = None
+
+    def stop(self):
+        self.enabled = False
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+
+        now = timer()
+        gc_count = gc.get_count()[0]
+        if self.frame_start is not None:
+            allocations = gc_count - self.gc_count
+            if allocations < 0:
+                # A collection ran and reset the counter
+                allocations += gc.get_threshold()[0]
+            frame = self.times
+            frame[FRAME] = now - self.frame_start
+            frame[ALLOCATIONS] = allocations
+            self.frames.append(frame)
+
+        self.times = {}
+        self.frame_start = now
+        self.gc_count = gc_count
+
+    def columns(self):
+        return [FRAME] + self.names + [ALLOCATIONS]
+
+    def averages(self, count=60):
+        """Mean of every column over the last `count` frames."""
+        frames = list(self.frames)[-count:]
+        if not frames:
+            return []
+        return [(name, sum(f.get(name, 0) for f in frames) / len(frames))
+            for name in self.columns()]
+
+    def dump_csv(self, f):
+        columns = self.columns()
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for frame in self.frames:
+            writer.writerow([frame.get(name, 0) for name in columns])
+
+    def dump_json(self, f):
+        json.dump({
+            'columns': self.columns(),
+            'frames': [[frame.get(name, 0) for name in self.columns()] for frame in self.frames],
+        }, f)
+
+    def dump(self, filename):
+        """Write recorded frames to `filename`, as JSON if it ends in .json, else CSV."""
+        with open(filename, 'wb') as f:
+            if filename.endswith('.json'):
+                self.dump_json(f)
+            else:
+                self.dump_csv(f)
+
+profiler = Profiler()
+
+class Overlay (object):
+    """Window handler drawing the profiler averages in a corner.
+
+    Push it before any other handler, so that it draws last.
+    """
+    TOGGLE_KEY = key.F3
+    FONT_SIZE = 10
+    MARGIN = 10
+    # Seconds between refreshing the text
+    REFRESH = .5
+
+    def __init__(self, window, profiler=profiler):
+        self.window = window
+        self.profiler = profiler
+        self.visible = False
+        self.label = pyglet.text.Label('', font_size=self.FONT_SIZE, multiline=True, width=400,
+            anchor_x='right', anchor_y='top', color=(0xEE, 0xEE, 0xEE, 0xFF))
+        self.refresh_at = 0
+
+    def on_key_press(self, sym, mods):
+        if sym == self.TOGGLE_KEY:
+            self.visible = not self.visible
+            if self.visible and not self.profiler.enabled:
+                self.profiler.start()
+            return pyglet.event.EVENT_HANDLED
+
+    def format(self):
+        lines = []
+        for name, value in self.profiler.averages():
+            if name == ALLOCATIONS:
+                lines.append('%-20s %8.0f' % (name, value))
+            else:
+                lines.append('%-20s %8.2f ms' % (name, value * 1000))
+        return '\n'.join(lines)
+
+    def on_draw(self):
+        if not self.visible:
+            return
+
+        now = timer()
+        if now > self.refresh_at:
+            self.label.text = self.format()
+            self.refresh_at = now + self.REFRESH
+
+        self.label.x = self.window.width - self.MARGIN
+        self.label.y = self.window.height - self.MARGIN
+        with gl_disable(GL_LIGHTING, GL_DEPTH_TEST):
+            with gl_ortho(self.window):
+                self.label.draw()
+
+def wrap_dispatch(window, profiler=profiler):
+    """Time the window's event handlers: drawing and everything else."""
+    dispatch_event = window.dispatch_event
+    draw = profiler.section('draw')
+    events = profiler.section('events')
+
+    def timed_dispatch_event(event_type, *args):
+        with draw if event_type == 'on_draw' else events:
+            return dispatch_event(event_type, *args)
+
+    window.dispatch_event = timed_dispatch_event
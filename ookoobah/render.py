@@ -2,8 +2,10 @@ from __future__ import division
 import pyglet
 from pyglet.gl import *
 import math
+from array import array
 
 import core
+import densegrid
 import shapes
 from spring import Spring
 from euclid import Vector3
@@ -15,15 +17,19 @@ class GameRenderer(object):
     Renders the score and calls all other game object renderers.
     """
     BACKGROUND_COLOR = (0.8862, 0.3215, 0.2784, 1)
+    # Seconds per frame for closing the holes that removed blocks leave in
+    # the batch's buffers
+    COMPACT_BUDGET = .001
 
-    def __init__(self, game):
+    def __init__(self, game, prepared=None):
         self.game = game
         self.batch = pyglet.graphics.Batch()
 
         # TODO: render the score and other labels
 
         # Init the renderers for all game objects
-        self.grid_renderer = GridRenderer(game.grid, self.batch)
+        self.grid_renderer = GridRenderer(game.grid, self.batch, prepared)
+        self.game.changed = set()
         self.ball_renderer = None
         self.lock_renderer = LockRenderer()
         self.mouse = Mouse(self.batch)
@@ -38,12 +44,18 @@ class GameRenderer(object):
     def tick(self):
         if self.ball_renderer:
             self.ball_renderer.update()
+        for pos in self.game.changed:
+            self.grid_renderer.wake(pos)
+        self.game.changed.clear()
         self.grid_renderer.update()
+        animator.tick()
         self.update_ball()
+        self.batch.compact(self.COMPACT_BUDGET)
 
     def draw(self, show_locks):
         # We can draw the batch only after all renderers updated it
         self.batch.draw()
+        clouds.draw()
         if show_locks:
             self.lock_renderer.draw(self.game.grid)
 
@@ -54,18 +66,26 @@ class GameRenderer(object):
         if self.grid_renderer:
             self.grid_renderer.delete()
             self.grid_renderer = None
+        self.lock_renderer.delete()
 
     def reset(self, game):
         self.delete()
         self.game = game
         self.grid_renderer = GridRenderer(game.grid, self.batch)
+        self.game.changed = set()
 
     def mark_dirty(self, pos):
         self.grid_renderer.dirty.append(pos)
+        self.lock_renderer.mark_dirty()
 
 class BlockRenderer (object):
     rotate = None
     shape_class = shapes.Box
+    # 'stream' for shapes whose colors are animated, see `ColorAnimator`
+    color_usage = 'dynamic'
+    # False for renderers that follow their block's state after creation;
+    # the others can be given a block shared by every cell alike
+    shares_block = True
 
     def __init__(self, batch, group, x, y, block):
         self.x = x
@@ -74,48 +94,43 @@ class BlockRenderer (object):
         self.shape = self.make_shape(batch, group)
 
     def make_shape(self, batch, group):
-        return self.shape_class(batch, group, (self.x, self.y, 0), self.size, tuple(self.color), self.rotate)
+        return self.shape_class(batch, group, (self.x, self.y, 0), self.size, tuple(self.color), self.rotate, self.get_angle(),
+            self.color_usage)
+
+    def get_angle(self):
+        return 0
+
+    def get_shapes(self):
+        return [self.shape]
 
     def delete(self):
         self.shape.delete()
 
     def update(self):
-        pass
+        """Animate towards the block's state; return True until settled."""
+        return False
 
 class Wall (BlockRenderer):
     size = (.9, .9, .9)
     color = (.3, .3, .3)
 
-class RotateGroup (pyglet.graphics.Group):
-    def __init__(self, x, y, angle, parent=None):
-        super(RotateGroup, self).__init__(parent)
-        self.x = x
-        self.y = y
-        self.angle = angle
-
-    def set_state(self):
-        glPushMatrix()
-        glTranslatef(self.x, self.y, 0)
-        glRotatef(self.angle, 0, 0, 1)
-
-    def unset_state(self):
-        glPopMatrix()
-
 class Mirror (BlockRenderer):
     size = (.8, .1, .9)
     color = (.1, .9, .9)
+    shares_block = False
 
     def __init__(self, batch, group, x, y, block):
-        group = RotateGroup(x, y, block.slope, parent=group)
-        super(Mirror, self).__init__(batch, group, 0, 0, block)
-
-        self.group = group
         self.slope = Spring(block.slope, 0.2, 0.1)
+        super(Mirror, self).__init__(batch, group, x, y, block)
+
+    def get_angle(self):
+        return 45 * self.slope.value
 
     def update(self):
         self.slope.next_value = self.block.slope
         self.slope.tick()
-        self.group.angle = 45 * self.slope.value
+        self.shape.set_angle(self.get_angle())
+        return not self.slope.static
 
 class FlipFlopMirror (Mirror):
     color = (.2, .5, .9)
@@ -125,18 +140,20 @@ class Launcher (BlockRenderer):
     color = hex_color_f("4D77CB")
     rotate = (math.pi / 2, 0, 0)
     shape_class = shapes.Pyramid
+    shares_block = False
 
     def __init__(self, batch, group, x, y, block):
-        group = RotateGroup(x, y, block.all_states_idx, parent=group)
-        super(Launcher, self).__init__(batch, group, 0, 0, block)
-
-        self.group = group
         self.state = Spring(block.all_states_idx, 0.2, 0.1)
+        super(Launcher, self).__init__(batch, group, x, y, block)
+
+    def get_angle(self):
+        return 90 * self.state.value
 
     def update(self):
         self.state.next_value = self.block.all_states_idx
         self.state.tick()
-        self.group.angle = 90 * self.state.value
+        self.shape.set_angle(self.get_angle())
+        return not self.state.static
 
 class OneWay (Launcher):
     color = hex_color_f("77CB4D")
@@ -153,10 +170,12 @@ class Trap (BlockRenderer):
 class FlipFlop (BlockRenderer):
     size = (.3, .3, .3)
     shape_class = shapes.Disc
+    color_usage = 'stream'
+    shares_block = False
 
     colors = {
-        False: Vector3(.5, .5, .5),
-        True: Vector3(.8, .8, .2)
+        False: (.5, .5, .5),
+        True: (.8, .8, .2)
     }
 
     THRESHOLD = 0.1
@@ -164,21 +183,23 @@ class FlipFlop (BlockRenderer):
 
     def __init__(self, batch, group, x, y, block):
         self.old_is_on = block.is_on
-        self.new_color = self.color = self.colors[block.is_on]
+        self.color = self.colors[block.is_on]
         super(FlipFlop, self).__init__(batch, group, x, y, block)
+        # Joins the animator on the first update, see `prepare_grid`
+        self.color_slot = None
+
+    def delete(self):
+        super(FlipFlop, self).delete()
+        if self.color_slot is not None:
+            animator.remove(self.color_slot)
 
     def update(self):
+        if self.color_slot is None:
+            self.color_slot = animator.add(self.shape, self.color, self.SPEED, self.THRESHOLD)
         if self.old_is_on != self.block.is_on:
-            self.new_color = self.colors[self.block.is_on]
             self.old_is_on = self.block.is_on
-
-        delta = self.new_color - self.color
-        if abs(delta) < self.THRESHOLD:
-            self.color = self.new_color.copy()
-        else:
-            self.color += delta * self.SPEED
-
-        self.shape.set_color(tuple(self.color))
+            animator.set_target(self.color_slot, self.colors[self.block.is_on])
+        return False
 
 class Exit (BlockRenderer):
     size = (.3,) * 3
@@ -187,38 +208,67 @@ class Exit (BlockRenderer):
     shape_class = shapes.Disc
     color_on = hex_color_f("34B27D")
     color_arr = hex_color_f("DBDB5780")
+    color_usage = 'stream'
+    shares_block = False
 
     def __init__(self, batch, group, x, y, block):
         super(Exit, self).__init__(batch, group, x, y, block)
-        self.arrows = shapes.Arrows(batch, group, (x, y, 0), self.size_arrow, self.color_arr)
-        self.alpha_arr = Spring(self.color_arr[3], .2, .01)
-        self.color_spr = Spring(Vector3(*self.color), .1, .01)
+        self.arrows = shapes.Arrows(batch, group, (x, y, 0), self.size_arrow, self.color_arr,
+            color_usage=self.color_usage)
+        # Joins the animator on the first update, see `prepare_grid`
+        self.color_slot = self.alpha_slot = None
         self.is_on = block.is_on
 
+    def get_shapes(self):
+        return [self.shape, self.arrows]
+
     def delete(self):
         super(Exit, self).delete()
         self.arrows.delete()
+        if self.color_slot is not None:
+            animator.remove(self.color_slot)
+            animator.remove(self.alpha_slot)
 
     def update(self):
+        if self.color_slot is None:
+            self.color_slot = animator.add(self.shape, self.color, .1, .01)
+            self.alpha_slot = animator.add(self.arrows, self.color_arr[3:], .2, .01, first=3)
         if self.is_on != self.block.is_on:
             self.is_on = self.block.is_on
             if self.is_on:
-                self.alpha_arr.next_value = 1
-                self.color_spr.next_value = Vector3(*self.color_on)
+                animator.set_target(self.alpha_slot, (1,))
+                animator.set_target(self.color_slot, self.color_on)
             else:
-                self.alpha_arr.next_value = self.color_arr[3]
-                self.color_spr.next_value = Vector3(*self.color)
-
-        self.alpha_arr.tick()
-        self.color_spr.tick()
-
-        self.shape.vlist.colors[:] = tuple(self.color_spr.value) * self.shape.vertex_count
-        self.arrows.vlist.colors[3::4] = (self.alpha_arr.value,) * self.arrows.vertex_count
+                animator.set_target(self.alpha_slot, self.color_arr[3:])
+                animator.set_target(self.color_slot, self.color)
+        return False
 
 class Swamp (BlockRenderer):
-    size = (1, 1, 1)
     color = hex_color_f("34B27D20")
-    shape_class = shapes.Cloud
+
+    def __init__(self, batch, group, x, y, block):
+        self.x = x
+        self.y = y
+        self.block = block
+        # Drawn by `clouds`, joined on the first update, see `prepare_grid`
+        self.joined = False
+
+    def get_angle(self):
+        # All clouds share one set of points, turn them so neighbours differ
+        return 90 * ((self.x * 3 + self.y) % 4)
+
+    def get_shapes(self):
+        return []
+
+    def delete(self):
+        if self.joined:
+            clouds.remove(self)
+
+    def update(self):
+        if not self.joined:
+            clouds.add(self)
+            self.joined = True
+        return False
 
 class Portal (BlockRenderer):
     size = (.2, .2, .2)
@@ -245,15 +295,169 @@ class GenericRenderer (BlockRenderer):
                 batch=batch, anchor_x='center', anchor_y='center',
                 group=ScalerGroup(x, y, parent=group))
 
+class ColorAnimator (object):
+    """Eases the vertex colors of many shapes towards their targets.
+
+    The current and target value of every animated color live in two flat
+    arrays, four channels per slot. A tick only walks the slots that are
+    still moving, and rewrites just their shapes' colors, each moving a
+    `speed` fraction of the way until it is closer than `snap`.
+    """
+    WIDTH = 4
+
+    def __init__(self):
+        self.current = array('d')
+        self.target = array('d')
+        self.slots = []
+        self.free = []
+        self.moving = set()
+
+    def add(self, shape, color, speed, snap, first=0):
+        """Animate channels `first`.. of the vertex colors of `shape`.
+
+        Returns the slot to pass to `set_target` and `remove`.
+        """
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.slots)
+            self.slots.append(None)
+            self.current.extend((0,) * self.WIDTH)
+            self.target.extend((0,) * self.WIDTH)
+
+        stride = len(shape.vlist.colors) // shape.vertex_count
+        self.slots[slot] = (shape, first, len(color), stride, speed, snap)
+        base = slot * self.WIDTH
+        self.current[base:base + len(color)] = array('d', color)
+        self.target[base:base + len(color)] = array('d', color)
+        return slot
+
+    def remove(self, slot):
+        self.slots[slot] = None
+        self.moving.discard(slot)
+        self.free.append(slot)
+
+    def set_target(self, slot, color):
+        base = slot * self.WIDTH
+        self.target[base:base + len(color)] = array('d', color)
+        self.moving.add(slot)
+
+    def tick(self):
+        current, target = self.current, self.target
+        for slot in list(self.moving):
+            shape, first, width, stride, speed, snap = self.slots[slot]
+            channels = range(slot * self.WIDTH, slot * self.WIDTH + width)
+
+            if math.sqrt(sum((target[i] - current[i]) ** 2 for i in channels)) < snap:
+                for i in channels:
+                    current[i] = target[i]
+                self.moving.remove(slot)
+            else:
+                for i in channels:
+                    current[i] += (target[i] - current[i]) * speed
+
+            colors = shape.vlist.colors
+            if width == stride:
+                colors[:] = tuple(current[i] for i in channels) * shape.vertex_count
+            else:
+                for c, i in enumerate(channels):
+                    colors[first + c::stride] = (current[i],) * shape.vertex_count
+
+animator = ColorAnimator()
+
+class CloudRenderer (object):
+    """The clouds of all swamps, from one vertex list.
+
+    The points of `shapes.Cloud` are uploaded once, the first time there is
+    a swamp to draw. Each swamp then draws the same list, moved to its cell
+    and turned by its angle, so memory and upload cost don't grow with the
+    number of swamps.
+    """
+
+    def __init__(self):
+        self.vlist = None
+        self.swamps = set()
+
+    def add(self, swamp):
+        self.swamps.add(swamp)
+
+    def remove(self, swamp):
+        self.swamps.discard(swamp)
+
+    def draw(self):
+        if not self.swamps:
+            return
+        if self.vlist is None:
+            verts, norms = shapes.Cloud.get_mesh()
+            count = len(verts) // 3
+            self.vlist = pyglet.graphics.vertex_list(count,
+                ('v3f/static', verts),
+                ('c4f/static', tuple(Swamp.color) * count)
+            )
+        for swamp in self.swamps:
+            glPushMatrix()
+            glTranslatef(swamp.x, swamp.y, 0)
+            glRotatef(swamp.get_angle(), 0, 0, 1)
+            self.vlist.draw(shapes.Cloud.primitive)
+            glPopMatrix()
+
+clouds = CloudRenderer()
+
 class GridRenderer(dict):
-    def __init__(self, grid, batch):
+    """Renderers for the blocks of a grid.
+
+    Only renderers that are animating get updated each frame. A renderer
+    animates after it is created and after `wake`, until its update reports
+    it has settled.
+    """
+
+    def __init__(self, grid, batch, prepared=None):
         self.grid = grid
         self.batch = batch
         self.dirty = []
-        self.update(True)
+        self.animating = set()
+
+        if prepared:
+            self.adopt(prepared)
+            self.dirty = [pos for pos in grid if pos not in self]
+            self.update()
+        else:
+            self.update(True)
+
+    def adopt(self, prepared):
+        """Take over renderers made by `prepare_grid`, uploading their shapes.
+
+        Renderers of blocks that are no longer in the grid are dropped.
+        """
+        for pos, renderer in prepared.iteritems():
+            if self.grid.get(pos) is renderer.block:
+                for shape in renderer.get_shapes():
+                    shape.vlist = shape.vlist.upload(self.batch)
+                self[pos] = renderer
+                self.animating.add(pos)
+
+    def wake(self, pos):
+        if pos in self:
+            self.animating.add(pos)
+
+    def create_all(self):
+        for pos, code, packed in densegrid.iter_codes(self.grid):
+            renderer_class = CORE_MAPPING.get(densegrid.CLASSES[code], GenericRenderer)
+            if renderer_class.shares_block:
+                block = densegrid.shared_block(code, packed)
+            else:
+                block = self.grid[pos]
+            self[pos] = renderer_class(self.batch, None, pos[0], pos[1], block)
+            self.animating.add(pos)
 
     def update(self, force=False):
-        items = self.grid if force else self.dirty
+        if force:
+            for renderer in self.values():
+                renderer.delete()
+            self.clear()
+            self.animating.clear()
+            self.create_all()
+        items = self.dirty
         self.dirty = []
 
         for pos in items:
@@ -263,30 +467,97 @@ class GridRenderer(dict):
 
             if self.grid.get(pos):
                 self[pos] = create_block_renderer(self.grid[pos], self.batch, None, *pos)
+                self.animating.add(pos)
             elif pos in self:
                 del self[pos]
+                self.animating.discard(pos)
 
-        [r.update() for r in self.itervalues()]
+        for pos in list(self.animating):
+            if not self[pos].update():
+                self.animating.remove(pos)
 
     def delete(self):
         for renderer in self.values():
             renderer.delete()
 
+class PendingVertexList (object):
+    """Vertex data recorded by `PendingBatch`, to be added to a real batch."""
+
+    def __init__(self, count, mode, group, data):
+        self.count = count
+        self.mode = mode
+        self.group = group
+        self.data = data
+
+    def upload(self, batch):
+        return batch.add(self.count, self.mode, self.group, *self.data)
+
+    def delete(self):
+        pass
+
+class PendingBatch (object):
+    """Stands in for a batch while renderers are made away from GL."""
+
+    def add(self, count, mode, group, *data):
+        return PendingVertexList(count, mode, group, data)
+
+def prepare_grid(grid):
+    """Make the renderers for `grid` without touching GL.
+
+    Safe to call from a worker thread. The result is passed to
+    `GridRenderer`, which uploads the vertex data on the main thread.
+    """
+    batch = PendingBatch()
+    return dict((pos, create_block_renderer(block, batch, None, *pos))
+        for pos, block in grid.items())
+
 class LockRenderer (object):
+    """Markers over locked blocks, all in one vertex list.
+
+    The list is rebuilt on the next draw after `mark_dirty`, or when asked
+    to draw a different grid.
+    """
+    SIZE = .4
+    HEIGHT = 1.1
+    COLOR = (.8, 0, 0, .5)
+
     def __init__(self):
-        self.sprite = pyglet.graphics.vertex_list(4,
-            ('v3f', (-.4, -.4, 0, .4, -.4, 0, .4, .4, 0, -.4, .4, 0)),
-            ('c4f', (.8, 0, 0, .5) * 4)
-        )
+        self.vlist = None
+        self.grid = None
+        self.dirty = True
 
-    def draw(self, grid):
+    def mark_dirty(self):
+        self.dirty = True
+
+    def rebuild(self, grid):
+        self.delete()
+
+        s, z = self.SIZE, self.HEIGHT
+        verts = []
         for (x, y), block in grid.iteritems():
-            if not block.locked:
-                continue
-            glPushMatrix()
-            glTranslatef(x, y, 1.1)
-            self.sprite.draw(GL_QUADS)
-            glPopMatrix()
+            if block.locked:
+                verts.extend((x - s, y - s, z, x + s, y - s, z, x + s, y + s, z, x - s, y + s, z))
+
+        count = len(verts) // 3
+        if count:
+            self.vlist = pyglet.graphics.vertex_list(count,
+                ('v3f/static', verts),
+                ('c4f/static', self.COLOR * count)
+            )
+        self.grid = grid
+        self.dirty = False
+
+    def draw(self, grid):
+        if self.dirty or grid is not self.grid:
+            self.rebuild(grid)
+        if self.vlist:
+            self.vlist.draw(GL_QUADS)
+
+    def delete(self):
+        if self.vlist:
+            self.vlist.delete()
+            self.vlist = None
+        self.dirty = True
 
 class BallGroup (pyglet.graphics.Group):
     def __init__(self, renderer, parent=None):
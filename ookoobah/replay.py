@@ -0,0 +1,47 @@
+"""Recording and replaying runs.
+
+A game created with a seed always plays out the same way, so a run can be
+recorded once into a `core.Log` and cached under `cache_key(grid, seed)`.
+`replay` then applies a log to a freshly started game to bring it to any
+step of the recorded run, without evaluating a single block rule.
+
+"""
+
+import hashlib
+
+import core
+import headless
+import levels
+
+def cache_key(grid, seed):
+    """Key for caching the run of a level with a given placement and seed."""
+    return hashlib.sha1(levels.dumps(grid)).hexdigest(), seed
+
+def record(grid, seed, max_steps=headless.MAX_STEPS):
+    """Run `grid` headless with `seed`, returning the result and its log."""
+    game = core.Game(grid, seed)
+    game.log = core.Log()
+    result = headless.run_game(game, max_steps)
+    return result, game.log
+
+def replay(game, log, steps=None):
+    """Apply the first `steps` steps of `log` (all by default) to a started game."""
+    for step, kind, x, y, value in log:
+        if steps is not None and step >= steps:
+            break
+
+        if kind == core.Log.ACT:
+            block = game.grid[x, y]
+            if isinstance(block, core.FlipFlop):
+                game.touch((x, y))
+                game.toggle_flipflop(block)
+            elif isinstance(block, core.FlipFlopMirror):
+                game.cycle_block((x, y))
+        elif kind == core.Log.BALL:
+            game.ball.pos = (x, y)
+            game.ball.direction = core.Ball.DIRECTIONS[value]
+            game.step_n = step + 1
+        elif kind == core.Log.STATUS:
+            game.ball.status = value
+
+    game._update_exit()
@@ -1,13 +1,65 @@
-from copy import deepcopy
+from collections import defaultdict
 import core
 
+class Snapshot(object):
+    """Game state as it was when the snapshot was taken.
+
+    Only the game-wide fields are copied up front. Blocks are recorded by
+    `core.Game.touch` the first time they are about to change, so both taking
+    and restoring a snapshot cost as much as the blocks changed in between.
+    Snapshots stack: each one only records changes made until the next one.
+    """
+
+    def __init__(self, name, game):
+        self.name = name
+        self.blocks = {}
+        ball = game.ball
+        self.ball = ball and (ball.pos, ball.direction, ball.status)
+        self.step_n = game.step_n
+        self.exit = game.exit
+        self.exit_pos = game.exit_pos
+        self.flipflops_off = game.flipflops_off
+        self.inventory = dict(game.inventory.inventory)
+        self.random_state = game.random.getstate()
+        self.log_length = len(game.log) if game.log is not None else None
+
+    def restore_blocks(self, game):
+        for pos, (block, state) in self.blocks.iteritems():
+            if block is None:
+                game.grid.pop(pos, None)
+            else:
+                block.set_state(state)
+                game.grid[pos] = block
+        self.blocks.clear()
+
+    def restore_game(self, game):
+        if self.ball is None:
+            game.ball = None
+        else:
+            pos, direction, status = self.ball
+            if game.ball is None:
+                game.ball = core.Ball(direction, pos)
+            game.ball.pos = pos
+            game.ball.direction = direction
+            game.ball.status = status
+        game.step_n = self.step_n
+        game.exit = self.exit
+        game.exit_pos = self.exit_pos
+        game.flipflops_off = self.flipflops_off
+        game.inventory.inventory = defaultdict(int, self.inventory)
+        game.random.setstate(self.random_state)
+        if game.log is not None and self.log_length is not None:
+            game.log.truncate(self.log_length)
+
 class Session(object):
-    def __init__(self, grid):
-        self.game = core.Game(grid)
-        self.original_game = None
+    START = "start"
+
+    def __init__(self, grid, seed=None):
+        self.game = core.Game(grid, seed)
+        self.snapshots = []
 
     def start(self):
-        self.original_game = deepcopy(self.game)
+        self.snapshot(Session.START)
         return self.game.start()
 
     def step(self):
@@ -17,6 +69,45 @@ class Session(object):
         return self.game.get_status()
 
     def reset(self):
-        if self.original_game:
-            self.game = self.original_game
-            self.original_game = None
+        if self.has_snapshot(Session.START):
+            self.restore(Session.START)
+            self.forget(Session.START)
+
+    def snapshot(self, name):
+        snapshot = Snapshot(name, self.game)
+        self.snapshots.append(snapshot)
+        self.game.journal = snapshot.blocks
+
+    def has_snapshot(self, name):
+        return any(s.name == name for s in self.snapshots)
+
+    def _find(self, name):
+        for idx in reversed(range(len(self.snapshots))):
+            if self.snapshots[idx].name == name:
+                return idx
+        raise KeyError(name)
+
+    def restore(self, name):
+        """Go back to the newest snapshot called `name`.
+
+        Snapshots taken after it are dropped, the snapshot itself is kept.
+        """
+        idx = self._find(name)
+        for snapshot in reversed(self.snapshots[idx:]):
+            snapshot.restore_blocks(self.game)
+        self.snapshots[idx].restore_game(self.game)
+        del self.snapshots[idx + 1:]
+        self.game.journal = self.snapshots[idx].blocks
+
+    def forget(self, name):
+        """Drop the newest snapshot called `name`, keeping the others valid."""
+        idx = self._find(name)
+        snapshot = self.snapshots.pop(idx)
+        if idx > 0:
+            previous = self.snapshots[idx - 1]
+            for pos, record in snapshot.blocks.iteritems():
+                previous.blocks.setdefault(pos, record)
+        if self.snapshots:
+            self.game.journal = self.snapshots[-1].blocks
+        else:
+            self.game.journal = None
@@ -1,58 +1,110 @@
 from __future__ import division
 import math
-from euclid import Vector3, Matrix4, Point3
+from euclid import Vector3, Matrix4
 from pyglet.gl import GL_TRIANGLES, GL_POINTS, GL_LINES
 import random
 
+def build_mesh(shape, do_normals):
+    """Flatten faces into vertex and per-vertex normal coordinate lists."""
+    verts = []
+    norms = []
+    for face in shape:
+        if do_normals:
+            a = Vector3(*face[1]) - Vector3(*face[0])
+            b = Vector3(*face[2]) - Vector3(*face[0])
+            n = tuple(a.cross(b).normalize())
+
+        for vert in face:
+            verts.extend(vert)
+            if do_normals:
+                norms.extend(n)
+    return verts, norms
+
 class Shape (object):
     primitive = GL_TRIANGLES
     do_normals = True
-    def __init__(self, batch, group, pos, size, color, rotate=None):
-        real = []
-        norm = []
+    # Unit-space mesh of each shape class, shared by all its instances
+    meshes = {}
 
-        matrix = Matrix4()
-        matrix.translate(*pos)
-        if rotate:
-            matrix.rotate_euler(*rotate)
-        matrix.scale(*size)
+    def __init__(self, batch, group, pos, size, color, rotate=None, angle=0, color_usage='dynamic'):
+        self.verts, self.norms = self.get_mesh()
 
+        self.pos = pos
         self.size = size
-        self.vertex_count = 0
-        for face in self.shape:
-            if self.do_normals:
-                a = Vector3(*face[1]) - Vector3(*face[0])
-                b = Vector3(*face[2]) - Vector3(*face[0])
-                n = a.cross(b).normalize()
-
-            for vert in face:
-                self.vertex_count += 1
-                real.extend(matrix * Point3(*vert))
-                if self.do_normals:
-                    norm.extend(n)
+        self.rotate = rotate
+        self.angle = angle
+        self.vertex_count = len(self.verts) // 3
 
         data = [
-            ('v3f', real),
-            ('c%df' % len(color), color * self.vertex_count)
+            ('v3f', transform(self.get_matrix(), self.verts)),
+            ('c%df/%s' % (len(color), color_usage), color * self.vertex_count)
         ]
         if self.do_normals:
-            data.append(('n3f', norm))
+            data.append(('n3f', turn(self.angle, self.norms)))
 
         self.vlist = batch.add(self.vertex_count, self.primitive, group, *data)
 
+    def get_matrix(self):
+        matrix = Matrix4()
+        matrix.translate(*self.pos)
+        if self.angle:
+            matrix.rotatez(math.radians(self.angle))
+        if self.rotate:
+            matrix.rotate_euler(*self.rotate)
+        matrix.scale(*self.size)
+        return matrix
+
+    def set_angle(self, angle):
+        """Turn the shape around the z axis through its position, in degrees.
+
+        The rotation is baked into the vertices, so that turned shapes share
+        their batch group and draw call with everything else.
+        """
+        if angle == self.angle:
+            return
+        self.angle = angle
+        self.vlist.vertices = transform(self.get_matrix(), self.verts)
+        if self.do_normals:
+            self.vlist.normals = turn(angle, self.norms)
+
+    @classmethod
+    def get_mesh(cls):
+        mesh = Shape.meshes.get(cls)
+        if mesh is None:
+            mesh = Shape.meshes[cls] = build_mesh(cls.shape, cls.do_normals)
+        return mesh
+
     def delete(self):
         self.vlist.delete()
 
     def move_to(self, pos):
-        self.vlist.vertices = [p + v * s
-            for face in self.shape
-            for vert in face
-            for p, v, s in zip(pos, vert, self.size)
-        ]
+        self.pos = pos
+        self.vlist.vertices = transform(self.get_matrix(), self.verts)
 
     def set_color(self, color):
         self.vlist.colors = color * self.vertex_count
 
+def transform(matrix, verts):
+    """Apply an affine `matrix` to a flat list of vertex coordinates."""
+    a, b, c, d = matrix.a, matrix.b, matrix.c, matrix.d
+    e, f, g, h = matrix.e, matrix.f, matrix.g, matrix.h
+    i, j, k, l = matrix.i, matrix.j, matrix.k, matrix.l
+    return [t
+        for x, y, z in zip(verts[0::3], verts[1::3], verts[2::3])
+        for t in (a * x + b * y + c * z + d, e * x + f * y + g * z + h, i * x + j * y + k * z + l)
+    ]
+
+def turn(angle, norms):
+    """Rotate a flat list of normals around the z axis by `angle` degrees."""
+    if not angle:
+        return norms
+    s = math.sin(math.radians(angle))
+    c = math.cos(math.radians(angle))
+    return [t
+        for x, y, z in zip(norms[0::3], norms[1::3], norms[2::3])
+        for t in (c * x - s * y, s * x + c * y, z)
+    ]
+
 class Box (Shape):
     shape = [
         ((.5, .5, -.5), (.5, -.5, -.5), (-.5, -.5, -.5)),
@@ -154,20 +206,23 @@ class Arrows (Shape):
         ((-.3, .5, .1), (-.5, .3, .1), (-.3, .3, .1))
     ]
 
+def make_cloud(count, seed):
+    rand = random.Random(seed)
+    return [
+        ((
+            rand.gauss(0, .25),
+            rand.gauss(0, .25),
+            rand.gauss(0, .25)
+        ),)
+        for _ in range(count)
+    ]
+
 class Cloud (Shape):
     primitive = GL_POINTS
     do_normals = False
-
-    @property
-    def shape(self):
-        return [
-            ((
-                random.gauss(0, .25),
-                random.gauss(0, .25),
-                random.gauss(0, .25)
-            ),)
-            for _ in range(1000)
-        ]
+    # Generated once; every cloud is this one, moved (and maybe turned).
+    # Swamps don't bake it per block, see `render.CloudRenderer`
+    shape = make_cloud(1000, 0x5a3)
 
 class Pine (Shape):
     shape = [
@@ -0,0 +1,369 @@
+"""Exhaustive puzzle solver.
+
+Searches placements of the inventory blocks for the ones that win a level.
+
+Rather than trying every placement up front, the solver plays the game and
+only branches when the ball is about to enter an empty cell that has not been
+decided on yet: the cell either stays empty for good, or gets one of the
+remaining blocks in one of its states. Cells the ball never reaches don't
+change the outcome, so each placement is simulated exactly once, and a branch
+is dropped as soon as its state repeats (the ball loops) or it runs out of
+steps.
+
+To keep the search finite, blocks are only placed inside the bounding box
+of the level, and a ball that leaves the box counts as lost. This is a
+restriction of the search, not a rule of the game: a block placed just
+outside the box could still send the ball back, so solutions that need one
+are missed.
+
+Different placements often leave the ball in the same state with the same
+blocks ahead of it, for example when it has flown past the cells where they
+differ. A transposition table shared by all branches keeps the outcome of
+each such position, keyed on the ball, the flip-flops, the remaining
+inventory and the decided cells that the ball can still reach.
+
+Only placements made before the start are searched: levels that need blocks
+clicked while the ball is moving come out unsolvable.
+
+"""
+
+from copy import deepcopy
+from collections import deque
+import multiprocessing
+
+import core
+import headless
+import session
+
+# Where each kind of block can send the ball; the others let it through
+DEFLECT = {
+    core.Trap: lambda block, dx, dy: (),
+    core.Wall: lambda block, dx, dy: ((-dx, -dy),),
+    core.Mirror: lambda block, dx, dy: ((dy * block.slope, dx * block.slope),),
+    core.FlipFlopMirror: lambda block, dx, dy: ((dy, dx), (-dy, -dx)),
+    core.OneWay: lambda block, dx, dy: (block.direction,),
+}
+
+class Solver(object):
+    class Error(Exception):
+        pass
+
+    # Placing these mid-run would change what Game.start() set up
+    UNSUPPORTED = (core.Launcher, core.Exit, core.Portal)
+
+    # Branches handed out per worker process
+    SPLIT = 4
+
+    def __init__(self, grid, inventory, max_steps=headless.MAX_STEPS, processes=1, bounds=None):
+        for block_class, count in inventory.items():
+            if count and issubclass(block_class, self.UNSUPPORTED):
+                raise Solver.Error("can't place %s blocks" % block_class.human_name)
+
+        self.grid = grid
+        self.inventory = inventory
+        self.max_steps = max_steps
+        self.processes = processes
+        self.bounds = bounds or core.get_bounds(grid)
+        # Transposition table, see `search`
+        self.table = {}
+
+    def solve(self):
+        """Return `(solutions, truncated)`: all winning placements found.
+
+        A solution is a tuple of `(pos, block_class, state_idx)` sorted by
+        position, where `state_idx` is the number of times the placed block
+        has to be cycled. `truncated` is True if some branch ran out of
+        `max_steps`, in which case there may be more solutions.
+        """
+        game = core.Game(deepcopy(self.grid))
+        game.inventory = deepcopy(self.inventory)
+        game.start()
+
+        if not headless.is_deterministic(game):
+            raise Solver.Error("portals pick their destination at random")
+
+        if self.processes == 1:
+            found, truncated = self.search(game, {})
+            return self.get_solutions((), found), truncated
+
+        # Play up to the first few decisions and hand the branches to the pool
+        solutions = []
+        truncated = False
+        frontier = [(game, {})]
+        while frontier and len(frontier) < self.processes * self.SPLIT:
+            branches = []
+            for game, decided in frontier:
+                pos = self.advance(game, decided)
+                if pos is None:
+                    found, finish_truncated = self.finish(game, game.step_n)
+                    solutions.extend(self.get_solutions(decided, found))
+                    truncated = truncated or finish_truncated
+                else:
+                    branches.extend(self.branch(game, decided, pos))
+            frontier = branches
+
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            results = pool.map(_search_branch, [(self, game, decided) for game, decided in frontier])
+        finally:
+            pool.close()
+            pool.join()
+
+        for (game, decided), (found, branch_truncated) in zip(frontier, results):
+            solutions.extend(self.get_solutions(decided, found))
+            truncated = truncated or branch_truncated
+        return solutions, truncated
+
+    def get_solutions(self, decided, found):
+        """Turn placements found below `decided` into sorted solutions."""
+        placements = [(pos,) + option for pos, option in dict(decided).items() if option]
+        return [tuple(sorted(placements + list(more))) for more, steps in found]
+
+    def search(self, game, decided):
+        """Play `game` out, trying every placement on the way.
+
+        Returns `(found, truncated)`: `found` lists `(placements, steps)` for
+        every win, with the placements made below this point and the steps
+        taken from here to the exit, and `truncated` tells if any branch ran
+        out of steps.
+        """
+        reachable = self.reachable(game, decided)
+        if not self.can_win(game, reachable):
+            return [], False
+
+        # The outcome depends on the steps left as well, so an entry made with
+        # more steps to spare serves any branch with less, and one that never
+        # ran out serves all of them
+        remaining = self.max_steps - game.step_n
+        key = self.get_key(game, decided, reachable)
+        entry = self.table.get(key)
+        if entry is not None:
+            found, truncated, entry_remaining = entry
+            if remaining <= entry_remaining:
+                found = [(more, steps) for more, steps in found if steps <= remaining]
+                return found, truncated or remaining < entry_remaining
+            elif not truncated:
+                return found, truncated
+
+        start = game.step_n
+        pos = self.advance(game, decided)
+        if pos is None:
+            found, truncated = self.finish(game, start)
+        else:
+            found, truncated = [], False
+            taken = game.step_n - start
+            for option in self.get_options(game):
+                # Play the option out on the game itself and roll it back
+                snapshot = session.Snapshot(None, game)
+                journal, game.journal = game.journal, snapshot.blocks
+                decided[pos] = option
+                self.place(game, pos, option)
+
+                child_found, child_truncated = self.search(game, decided)
+                placed = ((pos,) + option,) if option else ()
+                found.extend((placed + more, steps + taken) for more, steps in child_found)
+                truncated = truncated or child_truncated
+
+                snapshot.restore_blocks(game)
+                snapshot.restore_game(game)
+                game.journal = journal
+            del decided[pos]
+
+        self.table[key] = found, truncated, remaining
+        return found, truncated
+
+    def advance(self, game, decided):
+        """Step `game` until it is over or the ball is about to enter an
+        undecided empty cell. Returns that cell, or None.
+        """
+        key = headless.StateKey(game)
+        seen = set()
+
+        while game.get_status() == core.Game.STATUS_ON:
+            if game.step_n >= self.max_steps:
+                return None
+            if not self.inside(game.ball.pos):
+                # Nothing out there to bring the ball back
+                return None
+
+            state = key(game)
+            if state in seen:
+                return None
+            seen.add(state)
+
+            if self.has_blocks(game):
+                ball = game.ball
+                pos = (ball.pos[0] + ball.direction[0], ball.pos[1] + ball.direction[1])
+                if pos not in game.grid and pos not in decided and self.inside(pos):
+                    return pos
+
+            game.step()
+
+    def branch(self, game, decided, pos):
+        for option in self.get_options(game):
+            child = deepcopy(game)
+            child_decided = dict(decided)
+            child_decided[pos] = option
+            self.place(child, pos, option)
+            yield child, child_decided
+
+    def get_options(self, game):
+        """Ways to fill an empty cell: None to leave it empty, or a block
+        class and how many times to cycle it.
+        """
+        return [None] + [
+            (block_class, idx)
+            for block_class in core.ALL_BLOCKS if game.inventory.inventory.get(block_class)
+            for idx in range(len(block_class.all_states))
+        ]
+
+    def place(self, game, pos, option):
+        if option:
+            block_class, idx = option
+            game.place_block(pos, block_class)
+            for _ in range(idx):
+                game.cycle_block(pos)
+
+    def finish(self, game, start):
+        truncated = (game.get_status() == core.Game.STATUS_ON and
+            game.step_n >= self.max_steps)
+        if game.get_status() != core.Game.STATUS_VICTORY:
+            return [], truncated
+        return [((), game.step_n - start)], truncated
+
+    def get_key(self, game, decided, reachable):
+        """Everything the rest of a game depends on, for the table."""
+        grid = game.grid
+        return (
+            game.ball.pos,
+            game.ball.direction,
+            tuple(game.inventory.inventory.get(block_class, 0) for block_class in core.ALL_BLOCKS),
+            # Any flip-flop that is off keeps the exit shut
+            tuple(sorted((pos, block.is_on) for pos, block in core.find_blocks(grid, core.FlipFlop))),
+            frozenset((pos, decided[pos], grid[pos].get_state() if pos in grid else None)
+                for pos in reachable if pos in decided),
+            frozenset((pos, grid[pos].slope)
+                for pos in reachable if isinstance(grid.get(pos), core.FlipFlopMirror)),
+        )
+
+    def can_win(self, game, reachable):
+        """False if the exit or a flip-flop that is off is out of reach."""
+        if game.exit_pos not in reachable:
+            return False
+        return all(pos in reachable for pos, block in core.find_blocks(game.grid, core.FlipFlop)
+            if not block.is_on)
+
+    def get_turns(self, game):
+        """Map each direction to the ones the blocks left can turn it to."""
+        counts = game.inventory.inventory
+        turns = {}
+        for dx, dy in core.Ball.DIRECTIONS:
+            new = set()
+            if counts.get(core.Mirror) or counts.get(core.FlipFlopMirror):
+                new.update([(dy, dx), (-dy, -dx)])
+            if counts.get(core.Wall):
+                new.add((-dx, -dy))
+            if counts.get(core.OneWay):
+                new.update(core.Ball.DIRECTIONS)
+            new.discard((dx, dy))
+            turns[dx, dy] = tuple(new)
+        return turns
+
+    def reachable(self, game, decided):
+        """Return the cells the ball may still enter, whatever gets placed.
+
+        Follows the ball through every state each block can be in. At the
+        undecided cells it is also turned every way the blocks left allow,
+        as long as that takes no more blocks than there are. A cell that
+        turned the ball once may turn it again for free, as the block put
+        there stays.
+        """
+        grid = game.grid
+        min_x, min_y, max_x, max_y = self.bounds
+        budget = sum(count for block_class, count in game.inventory.items() if count > 0)
+        turns = self.get_turns(game)
+        ball = game.ball
+        # Fewest blocks placed to get the ball into each state, 0-1 BFS over
+        # the states where the ball changes direction
+        cost = {(ball.pos, ball.direction): 0}
+        # Blocks used by the time a block went into each undecided cell
+        placed = {}
+        todo = deque([(ball.pos, ball.direction, 0)])
+        cells = set()
+
+        while todo:
+            pos, direction, used = todo.popleft()
+            if cost[pos, direction] < used:
+                continue
+            (x, y), (dx, dy) = pos, direction
+            moves = ()
+            while True:
+                x += dx
+                y += dy
+                if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                    break
+                pos = (x, y)
+                cells.add(pos)
+
+                block = grid.get(pos)
+                if block is not None:
+                    if block.__class__ is core.Portal:
+                        cells.update(block.other_portals)
+                        moves = [(other, direction) for other in block.other_portals]
+                        break
+                    deflect = DEFLECT.get(block.__class__)
+                    if deflect is not None:
+                        moves = [(pos, new) for new in deflect(block, dx, dy)]
+                        break
+
+                if block is None and pos not in decided:
+                    # A block put here turns the ball every time it passes,
+                    # for the price of the first
+                    placed_at = placed.get(pos)
+                    if placed_at is None and used < budget:
+                        placed_at = placed[pos] = used + 1
+                    if placed_at is not None:
+                        turned = max(used, placed_at)
+                        for turn in turns[direction]:
+                            if cost.get((pos, turn), budget + 1) > turned:
+                                cost[pos, turn] = turned
+                                if turned == used:
+                                    todo.appendleft((pos, turn, turned))
+                                else:
+                                    todo.append((pos, turn, turned))
+
+                # The ball goes on the way it came, unless another ray got
+                # here first
+                if cost.get((pos, direction), budget + 1) <= used:
+                    break
+                cost[pos, direction] = used
+
+            for move in moves:
+                if cost.get(move, budget + 1) > used:
+                    cost[move] = used
+                    todo.appendleft(move + (used,))
+
+        return cells
+
+    def inside(self, (x, y)):
+        min_x, min_y, max_x, max_y = self.bounds
+        return min_x <= x <= max_x and min_y <= y <= max_y
+
+    def has_blocks(self, game):
+        return any(count > 0 for block_class, count in game.inventory.items())
+
+def _search_branch(args):
+    solver, game, decided = args
+    return solver.search(game, decided)
+
+def solve_level(grid, **kwds):
+    """Solve a level as saved by the editor: unlocked blocks go to the inventory.
+
+    Blocks may go anywhere within the bounds of the level as saved, including
+    the cells of the unlocked blocks. Returns `(solutions, truncated)`, see
+    `Solver.solve`.
+    """
+    kwds.setdefault('bounds', core.get_bounds(grid))
+    game = core.Game(grid)
+    game.build_inventory()
+    return Solver(game.grid, game.inventory, **kwds).solve()
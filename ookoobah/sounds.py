@@ -1,5 +1,3 @@
-import pyglet
-
 sounds = {}
 
 all_sounds = [
@@ -16,6 +14,8 @@ all_sounds = [
 ]
 
 def load():
+    # Imported here so that core (and headless runs) don't pull in pyglet
+    import pyglet
     for name in all_sounds:
         try:
             sounds[name] = pyglet.resource.media(name, streaming=False)
@@ -23,6 +23,9 @@ def load():
             print 'Failed to load %s: %s' % (name, e)
 
 def play(name, volume=0.4):
-    player = sounds[name].play()
+    sound = sounds.get(name)
+    if sound is None:
+        return None
+    player = sound.play()
     player.volume = volume
     return player
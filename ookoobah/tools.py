@@ -10,10 +10,10 @@ class DrawTool (BaseTool):
     def apply(self, pos, game, editor):
         old = game.grid.get(pos)
         if old.__class__ == self.block_class:
-            old.cycle_states()
+            game.cycle_block(pos)
         else:
             game.place_block(pos, self.block_class, not editor)
-            game.grid[pos].locked = editor
+            game.lock_block(pos, editor)
             return True
 
     def update_cursor(self, mouse):
@@ -29,10 +29,11 @@ class LockTool (BaseTool):
     def apply(self, pos, game, editor):
         obj = game.grid.get(pos)
         if obj:
-            obj.locked = not obj.locked
+            game.lock_block(pos, not obj.locked)
+            return True
 
 class TriggerTool (BaseTool):
     def apply(self, pos, game, editor):
         if pos in game.grid:
-            game.grid[pos].cycle_states()
+            game.cycle_block(pos)
 
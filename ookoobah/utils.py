@@ -1,4 +1,5 @@
 import core
+import densegrid
 
 CHAR_TO_BLOCK = {
     ".":  (None, ()),
@@ -57,7 +58,21 @@ def dump_game_to_string(game):
         else:
             return char
 
+    # One lookup per kind of block; blocks that change while the game runs
+    # (an exit turning on) are asked directly
+    codes = dict((pos, (code, packed)) for pos, code, packed in densegrid.iter_codes(grid))
+    kinds = {(0, 0): block_to_char(None)}
+
+    def char_at(pos):
+        code, packed = codes.get(pos, (0, 0))
+        if code in densegrid.LIVE_CODES:
+            return block_to_char(grid[pos])
+        char = kinds.get((code, packed))
+        if char is None:
+            char = kinds[code, packed] = block_to_char(densegrid.shared_block(code, packed))
+        return char
+
     (width, height) = game.grid_size()
-    chars = ((place_ball(ball, (x, y), block_to_char(grid.get((x, y)))) for x in range(width)) for y in range(height))
+    chars = ((place_ball(ball, (x, y), char_at((x, y))) for x in range(width)) for y in range(height))
 
     return "\n".join(" ".join(row) for row in chars)
@@ -162,6 +162,7 @@ __docformat__ = 'restructuredtext'
 __version__ = '$Id: $'
 
 import ctypes
+import timeit
 
 import pyglet
 from pyglet.gl import *
@@ -329,9 +330,15 @@ class Batch(object):
         # List of top-level groups
         self.top_groups = []
 
+        # Flat list of (function, arguments) to call to draw the batch, made
+        # by joining the draw lists of the top-level groups.
         self._draw_list = []
         self._draw_list_dirty = False
 
+        # Draw list of each group's subtree, kept until something is added
+        # to the subtree.
+        self._group_draw_lists = {}
+
     def invalidate(self):
         '''Force the batch to update the draw list.
 
@@ -340,6 +347,15 @@ class Batch(object):
 
         :since: pyglet 1.2
         '''
+        self._group_draw_lists.clear()
+        self._draw_list_dirty = True
+
+    def _invalidate_group(self, group):
+        '''Rebuild the draw lists of `group` and its ancestors on the next
+        draw.'''
+        while group is not None:
+            self._group_draw_lists.pop(group, None)
+            group = group.parent
         self._draw_list_dirty = True
 
     def add(self, count, mode, group, *data):
@@ -429,6 +445,41 @@ class Batch(object):
         domain = batch._get_domain(False, mode, group, formats)
         vertex_list.migrate(domain)
 
+    def compact(self, budget=None):
+        '''Compact the vertex domains of the batch.
+
+        Moves vertex lists to close the gaps left by deleted ones, and
+        shrinks buffers that are mostly unused; see
+        `pyglet.graphics.vertexdomain.VertexDomain.compact`.  Domains left
+        empty are dropped from the draw list.  A batch that
+        has vertex lists added and deleted all the time can call this once
+        a frame with a small budget.
+
+        :Parameters:
+            `budget` : float
+                Seconds to spend across all domains, or ``None`` to compact
+                fully.
+
+        :rtype: bool
+        :return: True if every domain is as compact as it will get.
+        '''
+        if budget is not None:
+            deadline = timeit.default_timer() + budget
+
+        for group, domain_map in self.group_map.items():
+            for domain in domain_map.values():
+                if domain._is_empty():
+                    # Have the next draw remove it
+                    self._invalidate_group(group)
+                    continue
+                if budget is not None:
+                    budget = deadline - timeit.default_timer()
+                    if budget <= 0:
+                        return False
+                if not domain.compact(budget):
+                    return False
+        return True
+
     def _get_domain(self, indexed, mode, group, formats):
         if group is None:
             group = null_group
@@ -451,7 +502,7 @@ class Batch(object):
                 domain = vertexdomain.create_domain(*formats)
             domain.__formats = formats
             domain_map[key] = domain
-            self._draw_list_dirty = True 
+            self._invalidate_group(group)
 
         return domain
 
@@ -465,14 +516,23 @@ class Batch(object):
             if group.parent not in self.group_children:
                 self.group_children[group.parent] = []
             self.group_children[group.parent].append(group)
-        self._draw_list_dirty = True
+        self._invalidate_group(group)
 
     def _update_draw_list(self):
-        '''Visit group tree in preorder and create a list of bound methods
-        to call.
+        '''Visit group tree in preorder and create a flat list of bound
+        methods to call, with their arguments.
+
+        Subtrees that have not changed since the last update reuse their
+        draw lists.  Empty domains and groups are removed from the batch
+        when the subtree holding them is visited again; until then an empty
+        domain draws nothing.
         '''
 
         def visit(group):
+            draw_list = self._group_draw_lists.get(group)
+            if draw_list is not None:
+                return draw_list
+
             draw_list = []
 
             # Draw domains using this group
@@ -482,8 +542,7 @@ class Batch(object):
                 if domain._is_empty():
                     del domain_map[(formats, mode, indexed)]
                     continue
-                draw_list.append(
-                    (lambda d, m: lambda: d.draw(m))(domain, mode))
+                draw_list.append((domain.draw, (mode,)))
 
             # Sort and visit child groups of this group
             children = self.group_children.get(group)
@@ -493,7 +552,17 @@ class Batch(object):
                     draw_list.extend(visit(child))
 
             if children or domain_map:
-                return [group.set_state] + draw_list + [group.unset_state]
+                # Leave out state changes that do nothing.  An unset_state
+                # and the next set_state are never merged: groups that
+                # compare equal share one entry in group_map, so an equal
+                # group can't follow, and a Group can't tell whether a
+                # different group sets the same state.
+                if _has_own(group, 'set_state'):
+                    draw_list.insert(0, (group.set_state, ()))
+                if _has_own(group, 'unset_state'):
+                    draw_list.append((group.unset_state, ()))
+                self._group_draw_lists[group] = draw_list
+                return draw_list
             else:
                 # Remove unused group from batch
                 del self.group_map[group]
@@ -550,8 +619,8 @@ class Batch(object):
         if self._draw_list_dirty:
             self._update_draw_list()
 
-        for func in self._draw_list:
-            func()
+        for func, args in self._draw_list:
+            func(*args)
 
     def draw_subset(self, vertex_lists):
         '''Draw only some vertex lists in the batch.
@@ -592,6 +661,12 @@ class Batch(object):
         for group in self.top_groups:
             visit(group)
 
+def _has_own(group, name):
+    '''Return True if the group's class overrides the `Group` method `name`.
+    '''
+    return getattr(group.__class__, name).im_func is not \
+        getattr(Group, name).im_func
+
 class Group(object):
     '''Group of common OpenGL state.
 
@@ -41,7 +41,8 @@ by `pyglet.graphics.vertexbuffer`.
  
 The allocator will at times request more space from the buffers. The current
 policy is to double the buffer size when there is not enough room to fulfil an
-allocation.  The buffer is never resized smaller.
+allocation.  The buffer is only resized smaller when a vertex domain is
+compacted (see `pyglet.graphics.vertexdomain.VertexDomain.compact`).
 
 The allocator maintains references to free space only; it is the caller's
 responsibility to maintain the allocated regions.
@@ -70,8 +71,8 @@ __version__ = '$Id: $'
 # -allocator does not track individual allocated regions.  Trusts caller
 #  to provide accurate (start, size) tuple, which completely describes
 #  a region from the allocator's point of view.
-# -this means that compacting is probably not feasible, or would be hideously
-#  expensive
+# -this means that compacting is left to the caller, which knows the regions:
+#  the allocator can only move a region it is told about (`relocate`)
 
 class AllocatorMemoryException(Exception):
     '''The buffer is not large enough to fulfil an allocation.
@@ -119,14 +120,15 @@ class Allocator(object):
     def set_capacity(self, size):
         '''Resize the maximum buffer size.
         
-        The capaity cannot be reduced.
+        The capacity cannot be reduced below the end of the last allocated
+        region.
 
         :Parameters:
             `size` : int
                 New maximum size of the buffer.
 
         '''
-        assert size > self.capacity
+        assert size >= self._get_end()
         self.capacity = size
 
     def alloc(self, size):
@@ -275,6 +277,32 @@ class Allocator(object):
         self.dealloc(start, size)
         return result
 
+    def relocate(self, start, size):
+        '''Move a region into free space before it, if there is enough.
+
+        The caller is responsible for moving the contents of the region.
+
+        :Parameters:
+            `start` : int
+                Starting index of the region.
+            `size` : int
+                Size of the region.
+
+        :rtype: int
+        :return: New starting index of the region, or None if it was not
+            moved.
+        '''
+        try:
+            new_start = self.alloc(size)
+        except AllocatorMemoryException:
+            return None
+
+        if new_start >= start:
+            self.dealloc(new_start, size)
+            return None
+        self.dealloc(start, size)
+        return new_start
+
     def dealloc(self, start, size):
         '''Free a region of the buffer.
 
@@ -397,8 +425,276 @@ class Allocator(object):
     def _is_empty(self):
         return not self.starts
 
+    def _get_end(self):
+        if not self.starts:
+            return 0
+        return self.starts[-1] + self.sizes[-1]
+
     def __str__(self):
         return 'allocs=' + repr(zip(self.starts, self.sizes))
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, str(self))
+
+class FreeListAllocator(Allocator):
+    '''Buffer space allocation that indexes the free space.
+
+    `Allocator` walks the allocated blocks from the start of the buffer on
+    every call, which gets slow once a buffer holds thousands of regions.
+    This allocator keeps track of the free blocks instead:
+
+    - by start and by end, so that a freed region is merged with its free
+      neighbours in constant time;
+    - by size, with one bin for each power of two, so that a block large
+      enough for a request is found by looking at a few bins.
+
+    A free block of exactly the requested size is preferred, so regions of
+    the same size (the common case) fill each other's holes without
+    splitting them.  The free space at the end of the buffer is kept apart
+    and only used when no hole is large enough.
+
+    The aggregate allocated regions are worked out from the free blocks
+    when `get_allocated_regions` is called, and kept until the next change.
+    '''
+    def __init__(self, capacity):
+        '''Create an allocator for a buffer of the specified capacity.
+
+        :Parameters:
+            `capacity` : int
+                Maximum size of the buffer.
+
+        '''
+        self.capacity = capacity
+
+        # Free blocks before the end of the allocated space, as
+        # start -> size and end -> start.
+        self._free_starts = {}
+        self._free_ends = {}
+        # Starts of the free blocks by their size, and the sizes present in
+        # each bin: bin i holds sizes in [2 ** i, 2 ** (i + 1)).
+        self._size_starts = {}
+        self._bins = []
+        # Total size of the free blocks
+        self._free_size = 0
+
+        # Everything from here to capacity is free
+        self._end = 0
+
+        self._regions = None
+
+    starts = property(lambda self: self.get_allocated_regions()[0])
+    sizes = property(lambda self: self.get_allocated_regions()[1])
+
+    def _add_free(self, start, size):
+        self._free_starts[start] = size
+        self._free_ends[start + size] = start
+        self._free_size += size
+        if size in self._size_starts:
+            self._size_starts[size].add(start)
+        else:
+            self._size_starts[size] = set((start,))
+            i = size.bit_length() - 1
+            while len(self._bins) <= i:
+                self._bins.append(set())
+            self._bins[i].add(size)
+
+    def _remove_free(self, start, size):
+        '''Remove the free block at `start`, or any block of `size` if
+        `start` is None.  Returns the start of the removed block.'''
+        starts = self._size_starts[size]
+        if start is None:
+            start = starts.pop()
+        else:
+            starts.remove(start)
+        if not starts:
+            del self._size_starts[size]
+            self._bins[size.bit_length() - 1].remove(size)
+        del self._free_starts[start]
+        del self._free_ends[start + size]
+        self._free_size -= size
+        return start
+
+    def _find_free(self, size):
+        '''Return the size of a free block of at least `size`, or None.'''
+        if size in self._size_starts:
+            return size
+
+        # Any size in a higher bin fits
+        i = size.bit_length() - 1
+        for sizes in self._bins[i + 1:]:
+            if sizes:
+                return min(sizes)
+
+        if i < len(self._bins):
+            for free_size in self._bins[i]:
+                if free_size > size:
+                    return free_size
+        return None
+
+    def alloc(self, size):
+        '''Allocate memory in the buffer.
+
+        Raises `AllocatorMemoryException` if the allocation cannot be
+        fulfilled.
+
+        :Parameters:
+            `size` : int
+                Size of region to allocate.
+               
+        :rtype: int
+        :return: Starting index of the allocated region.
+        '''
+        assert size >= 0
+
+        if size == 0:
+            return 0
+
+        free_size = self._find_free(size)
+        if free_size is not None:
+            # Take the front of the block, next to the region before it
+            start = self._remove_free(None, free_size)
+            if free_size > size:
+                self._add_free(start + size, free_size - size)
+            self._regions = None
+            return start
+
+        if self.capacity - self._end >= size:
+            start = self._end
+            self._end += size
+            self._regions = None
+            return start
+
+        raise AllocatorMemoryException(self._end + size)
+
+    def realloc(self, start, size, new_size):
+        '''Reallocate a region of the buffer.
+
+        The region grows in place when the space after it is free.
+
+        Raises `AllocatorMemoryException` if the allocation cannot be
+        fulfilled.
+
+        :Parameters:
+            `start` : int
+                Current starting index of the region.
+            `size` : int
+                Current size of the region.
+            `new_size` : int
+                New size of the region.
+
+        '''
+        assert size >= 0 and new_size >= 0
+
+        if new_size == 0:
+            if size != 0:
+                self.dealloc(start, size)
+            return 0
+        elif size == 0:
+            return self.alloc(new_size)
+
+        # Truncation is the same as deallocating the tail cruft
+        if new_size <= size:
+            self.dealloc(start + new_size, size - new_size)
+            return start
+
+        end = start + size
+        assert end <= self._end, 'Region not allocated'
+        extra = new_size - size
+        if end == self._end:
+            if self.capacity - end < extra:
+                raise AllocatorMemoryException(end + extra)
+            self._end += extra
+            self._regions = None
+            return start
+        free_size = self._free_starts.get(end, 0)
+        if free_size >= extra:
+            self._remove_free(end, free_size)
+            if free_size > extra:
+                self._add_free(end + extra, free_size - extra)
+            self._regions = None
+            return start
+
+        # Allocate first, so that a failed allocation leaves the region
+        # alone
+        result = self.alloc(new_size)
+        self.dealloc(start, size)
+        return result
+
+    def dealloc(self, start, size):
+        '''Free a region of the buffer.
+
+        :Parameters:
+            `start` : int
+                Starting index of the region.
+            `size` : int
+                Size of the region.
+
+        '''
+        assert size >= 0
+
+        if size == 0:
+            return
+
+        end = start + size
+        assert end <= self._end and start not in self._free_starts, \
+            'Region not allocated'
+
+        if start in self._free_ends:
+            free_start = self._free_ends[start]
+            self._remove_free(free_start, start - free_start)
+            start = free_start
+
+        if end == self._end:
+            self._end = start
+        else:
+            if end in self._free_starts:
+                free_size = self._free_starts[end]
+                self._remove_free(end, free_size)
+                end += free_size
+            self._add_free(start, end - start)
+        self._regions = None
+
+    def get_allocated_regions(self):
+        '''Get a list of (aggregate) allocated regions.
+
+        The result of this method is ``(starts, sizes)``, where ``starts`` is
+        a list of starting indices of the regions and ``sizes`` their
+        corresponding lengths.
+
+        :rtype: (list, list)
+        '''
+        if self._regions is None:
+            starts = []
+            sizes = []
+            alloc_start = 0
+            for free_start in sorted(self._free_starts):
+                if free_start > alloc_start:
+                    starts.append(alloc_start)
+                    sizes.append(free_start - alloc_start)
+                alloc_start = free_start + self._free_starts[free_start]
+            if self._end > alloc_start:
+                starts.append(alloc_start)
+                sizes.append(self._end - alloc_start)
+            self._regions = (starts, sizes)
+        return self._regions
+
+    def get_fragmented_free_size(self):
+        '''Returns the amount of space unused, not including the final
+        free block.
+
+        :rtype: int
+        '''
+        return self._free_size
+
+    def get_free_size(self):
+        '''Return the amount of space unused.
+        
+        :rtype: int
+        '''
+        return self._free_size + self.capacity - self._end
+
+    def _is_empty(self):
+        return self._end == 0
+
+    def _get_end(self):
+        return self._end
@@ -106,6 +106,9 @@ def create_mappable_buffer(size,
             True if a `VertexBufferObject` should be created if the driver
             supports it; otherwise only a `VertexArray` is created.
 
+    Buffers with ``GL_STREAM_DRAW`` usage are created as
+    `StreamingVertexBufferObject`.
+
     :rtype: `AbstractBuffer` with `AbstractMappable`
     '''
     from pyglet import gl
@@ -113,6 +116,8 @@ def create_mappable_buffer(size,
         gl_info.have_version(1, 5) and
         _enable_vbo and
         not gl.current_context._workaround_vbo):
+        if usage == GL_STREAM_DRAW:
+            return StreamingVertexBufferObject(size, target, usage)
         return MappableVertexBufferObject(size, target, usage)
     else:
         return VertexArray(size)
@@ -436,6 +441,51 @@ class MappableVertexBufferObject(VertexBufferObject, AbstractMappable):
         self._dirty_min = sys.maxint
         self._dirty_max = 0
 
+class StreamingVertexBufferObject(MappableVertexBufferObject):
+    '''A mappable VBO for data that is rewritten every frame.
+
+    On `bind` after a change, the data store is orphaned: the driver hands
+    out a new store while draws still in flight keep reading the old one,
+    so nothing waits on them.  The new store has no contents, so the whole
+    buffer is written to it, not only the changed range.
+
+    If the context has ``GL_ARB_map_buffer_range`` (core in OpenGL 3.0),
+    the store is orphaned and mapped at once with
+    ``GL_MAP_INVALIDATE_BUFFER_BIT`` and the data copied into the mapping.
+    Otherwise, or if the mapping fails, it is orphaned with a
+    ``glBufferData`` of no data and filled with ``glBufferSubData``.
+
+    Changes are still collected in a system memory copy first, as with
+    `MappableVertexBufferObject`.  The copy is kept on purpose: vertex lists
+    write to their regions at any time, not only between binds, and an
+    orphaned store needs the unchanged data as well.  `resize` and the
+    compaction of vertex domains also read from it, since a mapped store is
+    write-only.
+    '''
+    def __init__(self, size, target, usage):
+        super(StreamingVertexBufferObject, self).__init__(size, target, usage)
+        self._map_range = (gl_info.have_version(3, 0) or
+                           gl_info.have_extension('GL_ARB_map_buffer_range'))
+
+    def bind(self):
+        # Commit pending data to a new store
+        VertexBufferObject.bind(self)
+        if self._dirty_max > self._dirty_min:
+            if not (self._map_range and self._upload_mapped()):
+                glBufferData(self.target, self.size, None, self.usage)
+                glBufferSubData(self.target, 0, self.size, self.data_ptr)
+            self._dirty_min = sys.maxint
+            self._dirty_max = 0
+
+    def _upload_mapped(self):
+        ptr = glMapBufferRange(self.target, 0, self.size,
+            GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        if not ptr:
+            return False
+        ctypes.memmove(ptr, self.data_ptr, self.size)
+        # False if the store was lost while mapped
+        return glUnmapBuffer(self.target)
+
 class AbstractBufferRegion(object):
     '''A mapped region of a buffer.
 
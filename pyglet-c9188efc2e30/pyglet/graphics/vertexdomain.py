@@ -54,6 +54,10 @@ buffers automatically.
 The entire domain can be efficiently drawn in one step with the
 `VertexDomain.draw` method, assuming all the vertices comprise primitives of
 the same OpenGL primitive mode.
+
+Buffers grow as vertex lists are created but are not shrunk when they are
+deleted.  `VertexDomain.compact` moves vertex lists into the holes left
+behind and then shrinks the buffers; it can be run a little at a time.
 '''
 
 __docformat__ = 'restructuredtext'
@@ -61,6 +65,7 @@ __version__ = '$Id: $'
 
 import ctypes
 import re
+import timeit
 
 from pyglet.gl import *
 from pyglet.graphics import allocation, vertexattribute, vertexbuffer
@@ -154,9 +159,18 @@ class VertexDomain(object):
     '''
     _version = 0
     _initial_count = 16
+    _allocator_class = allocation.FreeListAllocator
+    # Buffers are shrunk when less than this fraction of them is in use
+    _shrink_usage = .25
 
     def __init__(self, attribute_usages):
-        self.allocator = allocation.Allocator(self._initial_count)
+        self.allocator = self._allocator_class(self._initial_count)
+
+        # Vertex lists by the end of their region, for compacting
+        self._vertex_lists = {}
+
+        # Allocated regions as ctypes arrays, see _get_draw_arrays
+        self._draw_arrays = None
 
         # If there are any MultiTexCoord attributes, then a TexCoord attribute
         # must be converted.
@@ -264,6 +278,33 @@ class VertexDomain(object):
             self.allocator.set_capacity(capacity)
             return self.allocator.realloc(start, count, new_count)
 
+    # Every allocation change goes with one of these, so they also drop the
+    # cached draw arrays.
+
+    def _track(self, vertex_list):
+        self._draw_arrays = None
+        if vertex_list.count:
+            end = vertex_list.start + vertex_list.count
+            self._vertex_lists[end] = vertex_list
+
+    def _untrack(self, vertex_list):
+        self._draw_arrays = None
+        if vertex_list.count:
+            end = vertex_list.start + vertex_list.count
+            self._vertex_lists.pop(end, None)
+
+    def _get_draw_arrays(self):
+        '''Return ``(starts, sizes, primcount)`` of the allocated regions,
+        with the starts and sizes as ctypes arrays ready for
+        ``glMultiDrawArrays``.  Kept until the next allocation change.'''
+        if self._draw_arrays is None:
+            starts, sizes = self.allocator.get_allocated_regions()
+            primcount = len(starts)
+            self._draw_arrays = ((GLint * primcount)(*starts),
+                                 (GLsizei * primcount)(*sizes),
+                                 primcount)
+        return self._draw_arrays
+
     def create(self, count):
         '''Create a `VertexList` in this domain.
 
@@ -274,7 +315,61 @@ class VertexDomain(object):
         :rtype: `VertexList`
         '''
         start = self._safe_alloc(count)
-        return VertexList(self, start, count)
+        vertex_list = VertexList(self, start, count)
+        self._track(vertex_list)
+        return vertex_list
+
+    def compact(self, budget=None):
+        '''Close the gaps between vertex lists and shrink the buffers.
+
+        The vertex list at the end of the domain is moved into free space
+        before it, one list at a time, until none of the free space is
+        large enough for the last list.  The buffers are then resized down
+        if most of them is unused.
+
+        The ``start`` of a moved vertex list changes, and the indices of an
+        `IndexedVertexList` are updated to match.  Regions previously
+        obtained from the list's attribute properties must be fetched
+        again.
+
+        :Parameters:
+            `budget` : float
+                Seconds to spend, or ``None`` to compact fully.  At least
+                one vertex list is moved on each call that has work to do.
+
+        :rtype: bool
+        :return: True if the domain is as compact as it will get, False if
+            the budget ran out first.
+        '''
+        if budget is not None:
+            deadline = timeit.default_timer() + budget
+
+        allocator = self.allocator
+        while allocator.get_fragmented_free_size():
+            vertex_list = self._vertex_lists.get(allocator._get_end())
+            if vertex_list is None:
+                break
+            new_start = allocator.relocate(vertex_list.start, vertex_list.count)
+            if new_start is None:
+                break
+            self._untrack(vertex_list)
+            vertex_list._move(new_start)
+            self._track(vertex_list)
+
+            if budget is not None and timeit.default_timer() > deadline:
+                return False
+
+        capacity = allocator.capacity
+        end = allocator._get_end()
+        if (capacity > self._initial_count and
+            end < capacity * self._shrink_usage):
+            # Leave room to grow, as _safe_alloc would
+            capacity = max(_nearest_pow2(end) * 2, self._initial_count)
+            self._version += 1
+            for buffer, _ in self.buffer_attributes:
+                buffer.resize(capacity * buffer.element_size)
+            allocator.set_capacity(capacity)
+        return True
 
     def draw(self, mode, vertex_list=None):
         '''Draw vertices in the domain.
@@ -292,6 +387,9 @@ class VertexDomain(object):
                 Vertex list to draw, or ``None`` for all lists in this domain.
 
         '''
+        if vertex_list is None and self.allocator._is_empty():
+            return
+
         glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
         for buffer, attributes in self.buffer_attributes:
             buffer.bind()
@@ -304,16 +402,13 @@ class VertexDomain(object):
         if vertex_list is not None:
             glDrawArrays(mode, vertex_list.start, vertex_list.count)
         else:
-            starts, sizes = self.allocator.get_allocated_regions()
-            primcount = len(starts)
+            starts, sizes, primcount = self._get_draw_arrays()
             if primcount == 0:
                 pass
             elif primcount == 1:
                 # Common case
                 glDrawArrays(mode, starts[0], sizes[0])
             elif gl_info.have_version(1, 4):
-                starts = (GLint * primcount)(*starts)
-                sizes = (GLsizei * primcount)(*sizes)
                 glMultiDrawArrays(mode, starts, sizes, primcount)
             else:
                 for start, size in zip(starts, sizes):
@@ -324,7 +419,7 @@ class VertexDomain(object):
         glPopClientAttrib()
 
     def _is_empty(self):
-        return not self.allocator.starts
+        return self.allocator._is_empty()
 
     def __repr__(self):
         return '<%s@%x %s>' % (self.__class__.__name__, id(self),
@@ -374,18 +469,29 @@ class VertexList(object):
 
         '''
         new_start = self.domain._safe_realloc(self.start, self.count, count)
+        self.domain._untrack(self)
         if new_start != self.start:
             # Copy contents to new location
-            for attribute in self.domain.attributes:
-                old = attribute.get_region(attribute.buffer,
-                                           self.start, self.count)
-                new = attribute.get_region(attribute.buffer,
-                                           new_start, self.count)
-                new.array[:] = old.array[:]
-                new.invalidate()
-        self.start = new_start
+            self._move(new_start)
         self.count = count
+        self.domain._track(self)
 
+        self._invalidate_caches()
+
+    def _move(self, start):
+        '''Copy the vertices to `start`, which must already be allocated.'''
+        for attribute in self.domain.attributes:
+            old = attribute.get_region(attribute.buffer,
+                                       self.start, self.count)
+            new = attribute.get_region(attribute.buffer,
+                                       start, self.count)
+            new.array[:] = old.array[:]
+            new.invalidate()
+        self.start = start
+
+        self._invalidate_caches()
+
+    def _invalidate_caches(self):
         self._colors_cache_version = None
         self._fog_coords_cache_version = None
         self._edge_flags_cache_version = None
@@ -397,6 +503,7 @@ class VertexList(object):
     def delete(self):
         '''Delete this group.'''
         self.domain.allocator.dealloc(self.start, self.count)
+        self.domain._untrack(self)
 
     def migrate(self, domain):
         '''Move this group from its current domain and add to the specified
@@ -422,16 +529,12 @@ class VertexList(object):
             new.invalidate()
 
         self.domain.allocator.dealloc(self.start, self.count)
+        self.domain._untrack(self)
         self.domain = domain
         self.start = new_start
+        domain._track(self)
 
-        self._colors_cache_version = None
-        self._fog_coords_cache_version = None
-        self._edge_flags_cache_version = None
-        self._normals_cache_version = None
-        self._secondary_colors_cache_version = None
-        self._tex_coords_cache_version = None
-        self._vertices_cache_version = None
+        self._invalidate_caches()
 
     def _set_attribute_data(self, i, data):
         attribute = self.domain.attributes[i]
@@ -607,7 +710,7 @@ class IndexedVertexDomain(VertexDomain):
     def __init__(self, attribute_usages, index_gl_type=GL_UNSIGNED_INT):
         super(IndexedVertexDomain, self).__init__(attribute_usages)
 
-        self.index_allocator = allocation.Allocator(self._initial_index_count)
+        self.index_allocator = self._allocator_class(self._initial_index_count)
 
         self.index_gl_type = index_gl_type
         self.index_c_type = vertexattribute._c_types[index_gl_type]
@@ -616,6 +719,21 @@ class IndexedVertexDomain(VertexDomain):
             self.index_allocator.capacity * self.index_element_size,
             target=GL_ELEMENT_ARRAY_BUFFER)
 
+    def _get_draw_arrays(self):
+        '''Return ``(starts, sizes, primcount)`` of the allocated index
+        regions, with the starts as pointers into the index buffer, ready
+        for ``glMultiDrawElements``.'''
+        if self._draw_arrays is None:
+            starts, sizes = self.index_allocator.get_allocated_regions()
+            primcount = len(starts)
+            ptr = self.index_buffer.ptr
+            size = self.index_element_size
+            self._draw_arrays = (
+                (ctypes.c_void_p * primcount)(*[ptr + s * size for s in starts]),
+                (GLsizei * primcount)(*sizes),
+                primcount)
+        return self._draw_arrays
+
     def _safe_index_alloc(self, count):
         '''Allocate indices, resizing the buffers if necessary.'''
         try:
@@ -650,7 +768,10 @@ class IndexedVertexDomain(VertexDomain):
         '''
         start = self._safe_alloc(count)
         index_start = self._safe_index_alloc(index_count)
-        return IndexedVertexList(self, start, count, index_start, index_count)
+        vertex_list = IndexedVertexList(self, start, count,
+                                        index_start, index_count)
+        self._track(vertex_list)
+        return vertex_list
 
     def get_index_region(self, start, count):
         '''Get a region of the index buffer.
@@ -684,6 +805,9 @@ class IndexedVertexDomain(VertexDomain):
                 Vertex list to draw, or ``None`` for all lists in this domain.
 
         '''
+        if vertex_list is None and self.allocator._is_empty():
+            return
+
         glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
         for buffer, attributes in self.buffer_attributes:
             buffer.bind()
@@ -699,25 +823,18 @@ class IndexedVertexDomain(VertexDomain):
                 self.index_buffer.ptr +
                     vertex_list.index_start * self.index_element_size)
         else:
-            starts, sizes = self.index_allocator.get_allocated_regions()
-            primcount = len(starts)
+            starts, sizes, primcount = self._get_draw_arrays()
             if primcount == 0:
                 pass
             elif primcount == 1:
                 # Common case
-                glDrawElements(mode, sizes[0], self.index_gl_type,
-                    self.index_buffer.ptr + starts[0])
+                glDrawElements(mode, sizes[0], self.index_gl_type, starts[0])
             elif gl_info.have_version(1, 4):
-                starts = [s * self.index_element_size + self.index_buffer.ptr for s in starts]
-                starts = ctypes.cast((GLuint * primcount)(*starts), ctypes.POINTER(ctypes.c_void_p))
-                sizes = (GLsizei * primcount)(*sizes)
-                glMultiDrawElements(mode, sizes, GL_UNSIGNED_INT, starts,
+                glMultiDrawElements(mode, sizes, self.index_gl_type, starts,
                                     primcount)
             else:
                 for start, size in zip(starts, sizes):
-                    glDrawElements(mode, size, self.index_gl_type,
-                        self.index_buffer.ptr +
-                            start * self.index_element_size)
+                    glDrawElements(mode, size, self.index_gl_type, start)
 
         self.index_buffer.unbind()
         for buffer, _ in self.buffer_attributes:
@@ -747,14 +864,8 @@ class IndexedVertexList(VertexList):
                 New number of indices in the list.
 
         '''
-        old_start = self.start
         super(IndexedVertexList, self).resize(count)
 
-        # Change indices (because vertices moved)
-        if old_start != self.start:
-            diff = self.start - old_start
-            self.indices[:] = map(lambda i: i + diff, self.indices)
-
         # Resize indices
         new_start = self.domain._safe_index_realloc(
             self.index_start, self.index_count, index_count)
@@ -769,6 +880,13 @@ class IndexedVertexList(VertexList):
         self.index_count = index_count
         self._indices_cache_version = None
 
+    def _move(self, start):
+        diff = start - self.start
+        super(IndexedVertexList, self)._move(start)
+
+        # Change indices (because vertices moved)
+        self.indices[:] = map(lambda i: i + diff, self.indices)
+
     def delete(self):
         '''Delete this group.'''
         super(IndexedVertexList, self).delete()
@@ -18,7 +18,7 @@ class Region(object):
 
 class RegionAllocator(object):
     def __init__(self, capacity):
-        self.allocator = allocation.Allocator(capacity)
+        self.allocator = fixture.allocator_class(capacity)
         self.regions = []
 
     def check_region(self, region):
@@ -141,6 +141,8 @@ class RegionAllocator(object):
     capacity = property(lambda self: self.allocator.capacity)
 
 class TestAllocation(unittest.TestCase):
+    allocator_class = allocation.Allocator
+
     def setUp(self):
         global fixture
         fixture = self
@@ -424,5 +426,34 @@ class TestAllocation(unittest.TestCase):
             allocator.dealloc(region) 
         self.assertTrue(allocator.get_free_size() == allocator.capacity)
 
+    def test_relocate_shrink(self):
+        allocator = RegionAllocator(40)
+        regions = []
+        for i in range(4):
+            regions.append(allocator.alloc(10))
+        allocator.dealloc(regions[1])
+        region = regions[3]
+        region.start = allocator.allocator.relocate(region.start, region.size)
+        self.assertTrue(region.start == 10)
+        self.assertTrue(allocator.allocator.relocate(region.start, region.size)
+                        is None)
+        allocator.check_coverage()
+        allocator.allocator.set_capacity(30)
+        self.assertTrue(allocator.get_free_size() == 0)
+
+class TestFreeListAllocation(TestAllocation):
+    allocator_class = allocation.FreeListAllocator
+
+    def test_reuse_holes(self):
+        allocator = RegionAllocator(100)
+        regions = []
+        for i in range(10):
+            regions.append(allocator.alloc(10))
+        for region in regions[1::2]:
+            allocator.dealloc(region)
+        for i in range(5):
+            allocator.alloc(10)
+        self.assertTrue(allocator.get_free_size() == 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+'''Tests that StreamingVertexBufferObject uploads what was written to it.
+
+GL is replaced by a fake that keeps buffer stores in memory, so no context
+is needed.  Each store is checked after bind, after resize and on both the
+mapped path and the ``glBufferSubData`` fallback.
+'''
+import ctypes
+import unittest
+
+import pyglet
+from pyglet.gl import gl_info
+from pyglet.gl import GL_ARRAY_BUFFER, GL_STREAM_DRAW, GL_DYNAMIC_DRAW
+from pyglet.graphics import vertexbuffer
+
+__noninteractive = True
+
+class FakeContext(object):
+    _workaround_vbo = False
+    _workaround_vbo_finish = False
+
+    def delete_buffer(self, id):
+        pass
+
+class FakeGL(object):
+    '''Buffer stores in memory, and a log of the calls made.'''
+    def __init__(self):
+        self.stores = {}
+        self.bound = {}
+        self.calls = []
+        self.next_id = 1
+        self.map_fails = False
+
+    def glGenBuffers(self, n, id):
+        id.value = self.next_id
+        self.next_id += 1
+
+    def glBindBuffer(self, target, id):
+        self.bound[target] = id
+
+    def glBufferData(self, target, size, data, usage):
+        self.calls.append('glBufferData')
+        store = (ctypes.c_byte * size)()
+        if data is not None:
+            ctypes.memmove(store, data, size)
+        self.stores[self.bound[target]] = store
+
+    def glBufferSubData(self, target, offset, size, data):
+        self.calls.append('glBufferSubData')
+        store = self.stores[self.bound[target]]
+        ctypes.memmove(ctypes.addressof(store) + offset, data, size)
+
+    def glMapBufferRange(self, target, offset, length, access):
+        self.calls.append('glMapBufferRange')
+        if self.map_fails:
+            return None
+        store = self.stores[self.bound[target]]
+        if access & vertexbuffer.GL_MAP_INVALIDATE_BUFFER_BIT:
+            # Orphaned: the new store starts out with garbage
+            store = self.stores[self.bound[target]] = (ctypes.c_byte * len(store))(*([-1] * len(store)))
+        return ctypes.addressof(store) + offset
+
+    def glUnmapBuffer(self, target):
+        return 1
+
+    def glPushClientAttrib(self, mask):
+        pass
+
+    def glPopClientAttrib(self):
+        pass
+
+    def store(self, buffer):
+        return list(self.stores[buffer.id])
+
+class StreamingBufferTestCase(unittest.TestCase):
+    version = '3.0'
+
+    def setUp(self):
+        self.gl = FakeGL()
+        self.saved = {}
+        for name in ('glGenBuffers', 'glBindBuffer', 'glBufferData',
+                     'glBufferSubData', 'glMapBufferRange', 'glUnmapBuffer',
+                     'glPushClientAttrib', 'glPopClientAttrib'):
+            self.saved[name] = getattr(vertexbuffer, name)
+            setattr(vertexbuffer, name, getattr(self.gl, name))
+        self.saved_context = pyglet.gl.current_context
+        pyglet.gl.current_context = FakeContext()
+        self.saved_version = gl_info._gl_info.version
+        gl_info._gl_info.version = self.version
+
+    def tearDown(self):
+        for name, func in self.saved.items():
+            setattr(vertexbuffer, name, func)
+        pyglet.gl.current_context = self.saved_context
+        gl_info._gl_info.version = self.saved_version
+
+    def create(self, size):
+        buffer = vertexbuffer.create_mappable_buffer(size, GL_ARRAY_BUFFER,
+                                                     GL_STREAM_DRAW)
+        self.assertTrue(isinstance(buffer,
+                                   vertexbuffer.StreamingVertexBufferObject))
+        return buffer
+
+    def write(self, buffer, start, values):
+        region = buffer.get_region(start, len(values),
+            ctypes.POINTER(ctypes.c_byte * len(values)))
+        region.array[:] = values
+        region.invalidate()
+
+    def test_dynamic_is_not_streaming(self):
+        buffer = vertexbuffer.create_mappable_buffer(16, GL_ARRAY_BUFFER,
+                                                     GL_DYNAMIC_DRAW)
+        self.assertTrue(type(buffer) is
+                        vertexbuffer.MappableVertexBufferObject)
+
+    def test_bind(self):
+        buffer = self.create(16)
+        self.write(buffer, 0, range(16))
+        buffer.bind()
+        self.assertEqual(self.gl.store(buffer), range(16))
+
+        # A small change still leaves the whole new store filled
+        self.write(buffer, 4, [40, 50])
+        buffer.bind()
+        expected = range(16)
+        expected[4:6] = [40, 50]
+        self.assertEqual(self.gl.store(buffer), expected)
+
+    def test_bind_unchanged(self):
+        buffer = self.create(16)
+        self.write(buffer, 0, range(16))
+        buffer.bind()
+        del self.gl.calls[:]
+        buffer.bind()
+        self.assertEqual(self.gl.calls, [])
+
+    def test_resize(self):
+        buffer = self.create(8)
+        self.write(buffer, 0, range(8))
+        buffer.bind()
+        buffer.resize(16)
+        self.assertEqual(self.gl.store(buffer), range(8) + [0] * 8)
+
+        self.write(buffer, 8, range(8, 16))
+        buffer.bind()
+        self.assertEqual(self.gl.store(buffer), range(16))
+
+    def test_mapping_fails(self):
+        if self.version != '3.0':
+            return
+        buffer = self.create(16)
+        self.write(buffer, 0, range(16))
+        self.gl.map_fails = True
+        del self.gl.calls[:]
+        buffer.bind()
+        self.assertEqual(self.gl.calls,
+            ['glMapBufferRange', 'glBufferData', 'glBufferSubData'])
+        self.assertEqual(self.gl.store(buffer), range(16))
+
+class StreamingBufferSubDataTestCase(StreamingBufferTestCase):
+    '''Without GL_ARB_map_buffer_range, glBufferSubData is used.'''
+    version = '1.5'
+
+    def test_no_mapping(self):
+        buffer = self.create(16)
+        self.write(buffer, 2, [7, 8])
+        del self.gl.calls[:]
+        buffer.bind()
+        self.assertEqual(self.gl.calls, ['glBufferData', 'glBufferSubData'])
+        self.assertEqual(self.gl.store(buffer), [0, 0, 7, 8] + [0] * 12)
+
+if __name__ == '__main__':
+    unittest.main()
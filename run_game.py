@@ -3,6 +3,18 @@
 
 Configures module path and libraries and then calls lib.main.main.
 
+    python run_game.py [--profile=FILE] [LEVEL]
+    python run_game.py --render=LEVEL [--frames=N] [--size=WxH] [--output=DIR]
+
+With LEVEL, only that level is played, and it can also be edited.
+
+With --profile, frame times are recorded from the start and written to FILE
+on exit. Press F3 in game to show them.
+
+With --render, the level is played for N frames (default 1) into a hidden
+offscreen framebuffer and the frame times are printed. With --output, every
+frame is also saved as a PNG file in DIR.
+
 """
 
 import os
@@ -13,5 +25,15 @@ if __name__ == "__main__":
     # Change to the game directory
     sys.path.insert(1, 'pyglet-c9188efc2e30')
 
+    opts, args = getopt.getopt(sys.argv[1:], "", ["profile=", "render=", "frames=", "size=", "output="])
+    opts = dict(opts)
+    frames = int(opts.get("--frames", 1))
+    if frames < 1:
+        sys.exit("--frames must be at least 1")
+
     import ookoobah.main
-    ookoobah.main.main()
+    if "--render" in opts:
+        size = tuple(int(n) for n in opts.get("--size", "800x600").split("x"))
+        ookoobah.main.render(opts["--render"], frames, opts.get("--output"), size)
+    else:
+        ookoobah.main.main(profile=opts.get("--profile"), level_name=args[0] if args else None)
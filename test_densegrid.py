@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+import unittest
+
+from ookoobah import core
+from ookoobah import densegrid
+
+class GridSizeTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(densegrid.DenseGrid().grid_size(), (0, 0))
+        self.assertEqual(core.Game({}).grid_size(), (0, 0))
+        self.assertEqual(core.Game(densegrid.DenseGrid()).grid_size(), (0, 0))
+
+    def test_emptied(self):
+        grid = densegrid.DenseGrid({(1, 2): core.Wall(), (3, 4): core.Wall()})
+        del grid[1, 2]
+        del grid[3, 4]
+        self.assertEqual(grid.grid_size(), (0, 0))
+
+    def test_shrinks_after_erase(self):
+        blocks = {(0, 0): core.Wall(), (4, 1): core.Wall(), (2, 5): core.Wall()}
+        game = core.Game(densegrid.DenseGrid(blocks))
+        reference = core.Game(dict(blocks))
+        self.assertEqual(game.grid_size(), (5, 6))
+        for pos in ((2, 5), (4, 1)):
+            game.erase_block(pos)
+            reference.erase_block(pos)
+            self.assertEqual(game.grid_size(), reference.grid_size())
+        self.assertEqual(game.grid_size(), (1, 1))
+
+if __name__ == "__main__":
+    unittest.main()
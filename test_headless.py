@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import unittest
+
+from ookoobah import core
+from ookoobah import headless
+from ookoobah import utils
+
+class RunTest(unittest.TestCase):
+    def test_escaping_ball_is_lost(self):
+        grid = {(0, 0): core.Launcher(), (5, 5): core.Exit()}
+        result = headless.run(grid)
+        self.assertEqual(result.status, core.Game.STATUS_DEFEAT)
+        # Out of the box at (6, 0), long before the step budget
+        self.assertEqual(result.steps, 6)
+        self.assertTrue(result.steps < headless.MAX_STEPS)
+
+    def test_escaping_ball_is_lost_after_bouncing(self):
+        grid = utils.make_grid_from_string("""
+            > . \\ o
+            . . . .
+            . . / .
+        """)
+        result = headless.run(grid)
+        self.assertEqual(result.status, core.Game.STATUS_DEFEAT)
+        self.assertTrue(result.steps < 10)
+
+    def test_victory(self):
+        grid = utils.make_grid_from_string("""
+            > . . o
+        """)
+        self.assertEqual(headless.run(grid).status, core.Game.STATUS_VICTORY)
+
+if __name__ == "__main__":
+    unittest.main()